@@ -4,6 +4,8 @@
 import subprocess
 import re
 
+import import_normalize
+
 DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
 DOCKER_CMD = ["docker", "exec", "-i", "supabase_db_NewMECAV2", "psql", "-U", "postgres", "-d", "postgres"]
 
@@ -13,14 +15,14 @@ COLUMN_MAP = {
     35: 36, 36: 37, 37: 35, 38: 38, 39: 40, 40: 39,
     **{i: i for i in range(41, 50)},
 }
-COUNTRY_NORMALIZE = {'USA': 'US', 'United States': 'US', 'U.S.A.': 'US', 'U.S.': 'US'}
+normalize_country = import_normalize.RESOLVERS['country'].resolve
 COUNTRY_COLS = [19, 24, 31]
 
 def transform_row(row):
     cols = row.split('\t')
     for idx in COUNTRY_COLS:
-        if idx < len(cols) and cols[idx] in COUNTRY_NORMALIZE:
-            cols[idx] = COUNTRY_NORMALIZE[cols[idx]]
+        if idx < len(cols) and cols[idx] != '\\N':
+            cols[idx] = normalize_country(cols[idx]) or cols[idx]
     filtered = [col for i, col in enumerate(cols) if i != SKIP_COL]
     output = ['\\N'] * 50
     for src_idx, dst_idx in COLUMN_MAP.items():
@@ -38,7 +40,11 @@ print(f"Found {len(lines)} profiles in dump")
 
 # Check for meca_id conflicts
 print("\nChecking for meca_id conflicts...")
-existing_meca_ids = {'701500', '700947', '202401'}
+proc = subprocess.run(DOCKER_CMD + ["-At"],
+    input=b"SELECT meca_id FROM public.profiles WHERE meca_id IS NOT NULL;",
+    capture_output=True)
+existing_meca_ids = set(proc.stdout.decode('utf-8').split())
+print(f"Existing meca_ids: {len(existing_meca_ids)}")
 
 conflict_rows = []
 for i, line in enumerate(lines):
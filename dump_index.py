@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+Dump index for dump_production.sql.
+
+Scans the dump once and records where every `COPY ... FROM stdin;` block lives
+(byte offsets, row count and column list), so the import scripts can seek
+straight to a table's data instead of reading and regex-scanning the whole
+file once per table. The same pass records the column order of every
+`CREATE TABLE` in the dump, for name-based column mapping.
+
+The index is saved next to the dump as <dump>.index.json and reused for as
+long as the dump's size and modification time are unchanged.
+
+DumpReader memory-maps the dump and hands out each block as a memoryview, with
+rows iterated lazily as bytes, so peak memory does not grow with the dump.
+iter_raw_chunks() cuts a block into batches at row boundaries without
+splitting it into rows at all, for loaders that send the bytes as they are.
+
+Compressed dumps (gzip, bzip2, xz, zstd; detected from the file's magic
+bytes) are read by stream decompression, with no expanded copy on disk.
+Offsets in their index are positions in the decompressed stream; a table's
+rows are reached by decompressing up to its block, so each pass over a
+table costs a decompression of the dump up to that table. zstd needs the
+zstandard package.
+
+Usage:
+    python dump_index.py [DUMP_FILE] [--rebuild]
+"""
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+import mmap
+import os
+import re
+import sys
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
+
+INDEX_SUFFIX = '.index.json'
+INDEX_VERSION = 3
+
+# Leading bytes of the compressed formats DumpReader can stream
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+FORMATS = ('plain',) + tuple(name for _, name in COMPRESSION_MAGIC)
+
+# Bytes decompressed and discarded per read when skipping to an offset
+SKIP_CHUNK_BYTES = 1 << 20
+
+# COPY public.profiles (id, email, ...) FROM stdin;
+# COPY profiles FROM stdin;
+COPY_RE = re.compile(
+    rb'^COPY\s+(?:"?(\w+)"?\.)?"?(\w+)"?\s*(?:\(([^)]*)\))?\s*FROM\s+stdin;'
+)
+
+# CREATE TABLE public.profiles (
+CREATE_TABLE_RE = re.compile(
+    rb'^CREATE\s+(?:UNLOGGED\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:"?(\w+)"?\.)?"?(\w+)"?\s*\('
+)
+
+# Lines inside CREATE TABLE (...) that are constraints, not columns
+TABLE_CONSTRAINT_WORDS = (b'CONSTRAINT', b'PRIMARY', b'UNIQUE', b'CHECK', b'FOREIGN', b'EXCLUDE', b'LIKE')
+
+# Indexes already loaded in this process, keyed by dump path
+_INDEX_CACHE = {}
+
+
+def detect_format(dump_path):
+    """'plain' or the compression of a dump, from its first bytes"""
+    with open(dump_path, 'rb') as f:
+        head = f.read(8)
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return 'plain'
+
+
+def open_dump(dump_path, fmt=None):
+    """Binary file object over the (decompressed) dump"""
+    fmt = fmt or detect_format(dump_path)
+    if fmt == 'plain':
+        return open(dump_path, 'rb')
+    if fmt == 'gzip':
+        return gzip.open(dump_path, 'rb')
+    if fmt == 'bz2':
+        return bz2.open(dump_path, 'rb')
+    if fmt == 'xz':
+        return lzma.open(dump_path, 'rb')
+    if fmt == 'zstd':
+        if zstandard is None:
+            raise SystemExit("ERROR: reading zstd dumps requires zstandard (pip install zstandard)")
+        raw = open(dump_path, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    raise ValueError(f"Unknown dump format: {fmt}")
+
+
+def skip_to(f, offset):
+    """Advance a (decompressing) stream to a byte offset by reading"""
+    remaining = offset
+    while remaining > 0:
+        chunk = f.read(min(remaining, SKIP_CHUNK_BYTES))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+
+
+def index_path_for(dump_path):
+    """Path of the sidecar index file for a dump"""
+    return dump_path + INDEX_SUFFIX
+
+
+def table_key(schema, name):
+    """Index key for a table: bare name for public, schema.name otherwise"""
+    if schema and schema != 'public':
+        return f"{schema}.{name}"
+    return name
+
+
+def parse_column_list(raw):
+    """Split a COPY column list into bare column names"""
+    if not raw:
+        return None
+    return [col.strip().strip('"') for col in raw.split(',') if col.strip()]
+
+
+def is_end_of_copy(line):
+    """True if line is the `\\.` terminator of a COPY block"""
+    return line.rstrip(b'\r\n') == b'\\.'
+
+
+def ddl_column_name(line):
+    """Column name from a line inside CREATE TABLE (...), or None"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith(b'--') or stripped.startswith(b')'):
+        return None
+    if stripped.split(None, 1)[0].upper() in TABLE_CONSTRAINT_WORDS:
+        return None
+    if stripped.startswith(b'"'):
+        end = stripped.find(b'"', 1)
+        return stripped[1:end].decode('utf-8') if end > 0 else None
+    return stripped.split(None, 1)[0].rstrip(b',').decode('utf-8')
+
+
+def build_index(dump_path, fmt=None):
+    """Scan the dump once and return the index of all COPY blocks and the
+    column order of every CREATE TABLE"""
+    fmt = fmt or detect_format(dump_path)
+    tables = {}
+    ddl = {}
+    offset = 0
+    current = None
+    ddl_columns = None
+
+    with open_dump(dump_path, fmt) as f:
+        for line in f:
+            if ddl_columns is not None:
+                if line.lstrip().startswith(b')'):
+                    ddl_columns = None
+                else:
+                    name = ddl_column_name(line)
+                    if name:
+                        ddl_columns.append(name)
+            elif current is not None:
+                if is_end_of_copy(line):
+                    current['data_end'] = offset
+                    current = None
+                else:
+                    current['rows'] += 1
+            elif line.startswith(b'COPY '):
+                match = COPY_RE.match(line)
+                if match:
+                    schema, name, cols = match.groups()
+                    key = table_key(
+                        schema.decode('utf-8') if schema else None,
+                        name.decode('utf-8'),
+                    )
+                    current = {
+                        'copy_offset': offset,
+                        'data_offset': offset + len(line),
+                        'data_end': None,
+                        'rows': 0,
+                        'columns': parse_column_list(cols.decode('utf-8') if cols else None),
+                    }
+                    tables[key] = current
+            elif line.startswith(b'CREATE '):
+                match = CREATE_TABLE_RE.match(line)
+                if match:
+                    schema, name = match.groups()
+                    key = table_key(
+                        schema.decode('utf-8') if schema else None,
+                        name.decode('utf-8'),
+                    )
+                    ddl_columns = ddl[key] = []
+            offset += len(line)
+
+    if current is not None:
+        # Truncated dump: keep what is there rather than failing the lookup
+        current['data_end'] = offset
+
+    stat = os.stat(dump_path)
+    return {
+        'version': INDEX_VERSION,
+        'dump_size': stat.st_size,
+        'dump_mtime_ns': stat.st_mtime_ns,
+        'format': fmt,
+        'tables': tables,
+        'ddl': ddl,
+    }
+
+
+def is_index_current(index, dump_path):
+    """True if a loaded index still describes the dump on disk"""
+    try:
+        stat = os.stat(dump_path)
+    except OSError:
+        return False
+    return (
+        index.get('version') == INDEX_VERSION
+        and index.get('dump_size') == stat.st_size
+        and index.get('dump_mtime_ns') == stat.st_mtime_ns
+    )
+
+
+def save_index(index, dump_path):
+    """Write the index next to the dump (best effort)"""
+    path = index_path_for(dump_path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"  WARNING: Could not save dump index to {path}: {e}")
+        return False
+    return True
+
+
+def load_index(dump_path, rebuild=False, fmt=None):
+    """Return the index for a dump, building and saving it if needed.
+    fmt forces the input format ('plain', 'gzip', ...), else it is detected."""
+    index = _INDEX_CACHE.get(dump_path)
+    if (index is not None and not rebuild and is_index_current(index, dump_path)
+            and (not fmt or index.get('format') == fmt)):
+        return index
+
+    index = None
+    path = index_path_for(dump_path)
+    if not rebuild and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if index is not None and not is_index_current(index, dump_path):
+            index = None
+        if index is not None and fmt and index.get('format') != fmt:
+            index = None
+
+    if index is None:
+        print(f"  Indexing dump {dump_path}...")
+        index = build_index(dump_path, fmt)
+        save_index(index, dump_path)
+        print(f"  Indexed {len(index['tables'])} COPY blocks")
+
+    _INDEX_CACHE[dump_path] = index
+    return index
+
+
+def get_block_info(dump_path, table_name):
+    """Index entry for a table's COPY block, or None if the dump has none"""
+    tables = load_index(dump_path)['tables']
+    return tables.get(table_name) or tables.get(table_name.split('.')[-1])
+
+
+def read_copy_block(dump_path, table_name):
+    """Raw bytes of a table's COPY data (rows only, terminator excluded)"""
+    info = get_block_info(dump_path, table_name)
+    if info is None:
+        return None
+    fmt = load_index(dump_path).get('format', 'plain')
+    with open_dump(dump_path, fmt) as f:
+        if fmt == 'plain':
+            f.seek(info['data_offset'])
+        else:
+            skip_to(f, info['data_offset'])
+        return f.read(info['data_end'] - info['data_offset'])
+
+
+def extract_copy_data(dump_path, table_name):
+    """Extract COPY data for a table as text, without the trailing newline"""
+    data = read_copy_block(dump_path, table_name)
+    if not data:
+        return None
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    return text[:-1] if text.endswith('\n') else text
+
+
+class CopyChunk:
+    """A run of whole rows of a COPY block, kept as the block's bytes.
+
+    Behaves as the sequence of its rows, but the bytes are only split into
+    rows when the chunk is indexed, sliced or iterated (bad-row isolation);
+    a loader that sends .data never touches a row.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._count = data.count(b'\n')
+        if data and not data.endswith(b'\n'):
+            self._count += 1
+        self._rows = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        return self.rows()[key]
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def rows(self):
+        if self._rows is None:
+            rows = self.data.split(b'\n')
+            if rows and not rows[-1]:
+                rows.pop()
+            self._rows = [row[:-1] if row.endswith(b'\r') else row for row in rows]
+        return self._rows
+
+
+class DumpReader:
+    """Memory-mapped, zero-copy access to the COPY blocks of a dump.
+
+    block() returns a memoryview into the mapping and iter_rows() yields one
+    row at a time as bytes (line terminator stripped); nothing is decoded, so
+    callers only pay for the fields they actually touch.
+
+    A compressed dump is not mapped: every iter_rows()/iter_chunks() pass
+    opens its own decompressing stream (so concurrent passes are safe) and
+    block() returns bytes.
+    """
+
+    def __init__(self, dump_path, fmt=None):
+        self.dump_path = dump_path
+        self.index = load_index(dump_path, fmt=fmt)
+        self.format = self.index.get('format', 'plain')
+        self._file = None
+        self._mmap = None
+        if self.format != 'plain':
+            return
+        self._file = open(dump_path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file: mmap refuses zero-length mappings
+            self._mmap = None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block_info(self, table_name):
+        """Index entry for a table's COPY block, or None"""
+        tables = self.index['tables']
+        return tables.get(table_name) or tables.get(table_name.split('.')[-1])
+
+    def row_count(self, table_name):
+        info = self.block_info(table_name)
+        return info['rows'] if info else 0
+
+    def dump_columns(self, table_name):
+        """Dump column names of a table: the COPY column list if it has one,
+        else the dump's CREATE TABLE; None if the dump names neither"""
+        info = self.block_info(table_name)
+        if info and info.get('columns'):
+            return info['columns']
+        ddl = self.index.get('ddl', {})
+        return ddl.get(table_name) or ddl.get(table_name.split('.')[-1])
+
+    def column_count(self, table_name):
+        """Columns per row: from the COPY column list, else the first row"""
+        info = self.block_info(table_name)
+        if info is None:
+            return 0
+        if info.get('columns'):
+            return len(info['columns'])
+        for row in self.iter_rows(table_name):
+            return row.count(b'\t') + 1
+        return 0
+
+    def block(self, table_name):
+        """memoryview over a table's COPY rows (terminator excluded), or None"""
+        info = self.block_info(table_name)
+        if info is None:
+            return None
+        if self.format != 'plain':
+            return read_copy_block(self.dump_path, table_name)
+        if self._mmap is None:
+            return None
+        return memoryview(self._mmap)[info['data_offset']:info['data_end']]
+
+    def iter_rows(self, table_name, start=None):
+        """Yield each row of a table's COPY block as bytes, lazily.
+
+        start is a dump byte offset inside the block where a row begins (a
+        chunk end from iter_chunks); rows before it are skipped without
+        being read.
+        """
+        info = self.block_info(table_name)
+        if info is None:
+            return
+        if self.format != 'plain':
+            for _, row in self._stream_rows(info, start):
+                yield row
+            return
+        if self._mmap is None:
+            return
+        mm = self._mmap
+        pos = max(info['data_offset'], start or 0)
+        end = info['data_end']
+        while pos < end:
+            nl = mm.find(b'\n', pos, end)
+            if nl < 0:
+                nl = end
+            row = mm[pos:nl]
+            if row.endswith(b'\r'):
+                row = row[:-1]
+            yield row
+            pos = nl + 1
+
+    def iter_chunks(self, table_name, chunk_rows, start=None, stop=None):
+        """Yield (start offset, end offset, rows) for consecutive chunks of up
+        to chunk_rows rows. The offsets are dump byte offsets of the chunk's
+        first row and just past its last row, so iter_rows/iter_chunks(start=
+        end) continue after it; stop ends the scan early at a chunk end."""
+        info = self.block_info(table_name)
+        if info is None:
+            return
+        if self.format != 'plain':
+            yield from self._stream_chunks(info, chunk_rows, start, stop)
+            return
+        if self._mmap is None:
+            return
+        mm = self._mmap
+        pos = max(info['data_offset'], start or 0)
+        end = info['data_end'] if stop is None else min(stop, info['data_end'])
+        while pos < end:
+            chunk_start = pos
+            rows = []
+            while pos < end and len(rows) < chunk_rows:
+                nl = mm.find(b'\n', pos, end)
+                if nl < 0:
+                    nl = end
+                row = mm[pos:nl]
+                if row.endswith(b'\r'):
+                    row = row[:-1]
+                rows.append(row)
+                pos = nl + 1
+            yield chunk_start, min(pos, end), rows
+
+    def iter_raw_chunks(self, table_name, chunk_rows, start=None, stop=None):
+        """Like iter_chunks, but each chunk is a CopyChunk over the dump's
+        bytes, cut at the first row boundary after about chunk_rows rows'
+        worth of bytes (the block's mean row length); no row is split.
+        Compressed dumps have no bytes to hand out and yield row lists."""
+        info = self.block_info(table_name)
+        if info is None:
+            return
+        if self.format != 'plain':
+            yield from self._stream_chunks(info, chunk_rows, start, stop)
+            return
+        if self._mmap is None:
+            return
+        mm = self._mmap
+        pos = max(info['data_offset'], start or 0)
+        end = info['data_end'] if stop is None else min(stop, info['data_end'])
+        span = max(1, (info['data_end'] - info['data_offset']) * chunk_rows // max(1, info['rows']))
+        while pos < end:
+            cut = min(pos + span, end)
+            if cut < end:
+                nl = mm.find(b'\n', cut - 1, end)
+                cut = end if nl < 0 else nl + 1
+            yield pos, cut, CopyChunk(mm[pos:cut])
+            pos = cut
+
+    def _stream_rows(self, info, start=None, stop=None):
+        """(end offset, row) for the rows of a block, read from a fresh
+        decompressing stream"""
+        pos = max(info['data_offset'], start or 0)
+        end = info['data_end'] if stop is None else min(stop, info['data_end'])
+        with open_dump(self.dump_path, self.format) as f:
+            skip_to(f, pos)
+            while pos < end:
+                line = f.readline()
+                if not line:
+                    break
+                pos += len(line)
+                row = line[:-1] if line.endswith(b'\n') else line
+                if row.endswith(b'\r'):
+                    row = row[:-1]
+                yield min(pos, end), row
+
+    def _stream_chunks(self, info, chunk_rows, start=None, stop=None):
+        chunk_start = max(info['data_offset'], start or 0)
+        rows = []
+        for pos, row in self._stream_rows(info, start, stop):
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                yield chunk_start, pos, rows
+                chunk_start = pos
+                rows = []
+        if rows:
+            yield chunk_start, pos, rows
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    dump_path = args[0] if args else DUMP_FILE
+    index = load_index(dump_path, rebuild='--rebuild' in sys.argv)
+
+    print(f"Index: {index_path_for(dump_path)}")
+    for name, info in sorted(index['tables'].items()):
+        cols = len(info['columns']) if info['columns'] else '-'
+        print(f"  {name:<40} rows={info['rows']:<8} cols={cols:<4} offset={info['data_offset']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+All-or-nothing historical import (--atomic).
+
+Normally every table loads on its own connections and every batch commits
+on its own, with foreign-key triggers off (session_replication_role =
+replica), so a failure mid-run leaves the database half-imported and
+dangling references are never noticed. With --atomic the whole run uses one
+connection and one transaction:
+
+- AtomicDatabase stands in for import_db.Database; every session, query and
+  batch of every table runs on its single connection, and the `with conn:`
+  blocks of the loaders no longer commit (savepoints still isolate bad rows)
+- deferrable constraints are deferred to the end of the transaction, and
+  FK triggers stay off while loading, so nothing is checked row by row
+- before commit every foreign key of the loaded tables is checked with one
+  set-based anti-join (validate_foreign_keys); any dangling reference, or a
+  table that failed, rolls the whole run back
+
+The foreign keys are read from the catalog at validation time, so keys to
+tables outside the import (and in other schemas) are checked too.
+"""
+
+from contextlib import contextmanager
+
+import import_db
+
+# Dangling keys shown per foreign key
+SAMPLE_KEYS = 5
+
+FOREIGN_KEYS_SQL = """
+SELECT
+    con.conname AS name,
+    con.conrelid::regclass::text AS child,
+    con.confrelid::regclass::text AS parent,
+    con.confmatchtype AS match,
+    (
+        SELECT array_agg(a.attname ORDER BY k.ord)
+        FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+    ) AS columns,
+    (
+        SELECT array_agg(a.attname ORDER BY k.ord)
+        FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+    ) AS ref_columns
+FROM pg_constraint con
+WHERE con.contype = 'f' AND con.conrelid = ANY(%s::regclass[])
+ORDER BY child, name
+"""
+
+
+class _Transaction:
+    """Connection stand-in whose `with` blocks neither commit nor roll back"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+
+    @property
+    def closed(self):
+        return self._conn.closed
+
+
+class AtomicDatabase(import_db.Database):
+    """One connection of a Database, holding one transaction open until
+    commit() or rollback()"""
+
+    def __init__(self, db):
+        self.dsn = db.dsn
+        self.pool = db.pool
+        self._conn = self.pool.getconn()
+        self._transaction = _Transaction(self._conn)
+        self.failed = False
+        with self._conn.cursor() as cur:
+            cur.execute("SET CONSTRAINTS ALL DEFERRED")
+
+    @contextmanager
+    def connection(self):
+        yield self._transaction
+
+    @contextmanager
+    def session(self):
+        yield self._transaction
+
+    def commit(self):
+        self._conn.commit()
+        self._release()
+
+    def rollback(self):
+        if not self._conn.closed:
+            self._conn.rollback()
+        self._release()
+
+    def close(self):
+        """Release the connection, rolling back anything not committed"""
+        if self._conn is not None:
+            self.rollback()
+
+    def _release(self):
+        self.pool.putconn(self._conn, close=bool(self._conn.closed))
+        self._conn = None
+
+
+def foreign_keys(db, tables):
+    """Foreign keys of the given tables, from the catalog"""
+    return db.query(FOREIGN_KEYS_SQL, ([f"public.{table}" for table in tables],))
+
+
+def validate_foreign_keys(db, tables, log):
+    """Check every foreign key of the tables with one anti-join each;
+    returns [(name, dangling rows, sample keys)] of the violated ones"""
+    violations = []
+    for fk in foreign_keys(db, tables):
+        child = [f"c.{col}" for col in fk.columns]
+        match = ' AND '.join(f"p.{ref} = {col}" for ref, col in zip(fk.ref_columns, child))
+        if fk.match == 'f':
+            # MATCH FULL: all NULL is fine, partly NULL never matches
+            present = f"NOT ({' AND '.join(f'{col} IS NULL' for col in child)})"
+        else:
+            present = ' AND '.join(f"{col} IS NOT NULL" for col in child)
+        where = f"""
+            FROM {fk.child} c
+            WHERE {present}
+              AND NOT EXISTS (SELECT 1 FROM {fk.parent} p WHERE {match})
+        """
+        dangling = db.query_value(f"SELECT COUNT(*) {where}")
+        target = f"{fk.parent} ({', '.join(fk.ref_columns)})"
+        if not dangling:
+            log(f"  {fk.child}.{fk.name}: OK -> {target}")
+            continue
+        keys = ' || \', \' || '.join(f"coalesce({col}::text, 'NULL')" for col in child)
+        samples = [row[0] for row in db.query(
+            f"SELECT DISTINCT {keys} {where} LIMIT {SAMPLE_KEYS}")]
+        log(f"  {fk.child}.{fk.name}: {dangling} rows reference missing {target}, "
+            f"e.g. {', '.join(samples)}")
+        violations.append((fk.name, dangling, samples))
+    return violations
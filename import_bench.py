@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Synthetic dumps and benchmarks for the historical import.
+
+generate: writes a dump_production.sql-shaped file (CREATE TABLE DDL plus
+`COPY public.t (cols) FROM stdin;` blocks) at a multiple of the production
+volumes in IMPORT_MAPPING_DOCUMENT.md. Columns and types come from the live
+schema (import_schema.py) plus the columns the production dump has and the
+local schema dropped, in the production column order (profiles' permuted
+columns and orders' 13 dump-only columns are read from the production schema
+DDL, schema_baseline_20260121.sql); values follow the production
+distributions that matter to the importer (country/state spellings, status
+enums, NULL rates, unique meca_ids, FKs pointing at generated parents).
+
+run: times the extract (dump scan), transform (projection plan) and load
+(COPY into a rolled-back staging table) phases of every table against the
+database in IMPORT_DATABASE_URL, reports rows/sec and peak RSS, and compares
+them with stored baselines; a phase more than --tolerance slower than its
+baseline is flagged and makes the run exit non-zero.
+
+Usage:
+    python import_bench.py generate --scale 10 --out bench_10x.sql
+    python import_bench.py run --dump bench_10x.sql [--engine row|columnar]
+                               [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+
+import dump_index
+import import_columnar
+import import_db
+import import_mapping
+import import_normalize
+import import_report
+import import_schema
+from import_historical_final import NORMALIZE_COLUMNS, TABLE_DEPENDENCIES
+from import_scheduler import dependency_levels
+
+# Production row counts (IMPORT_MAPPING_DOCUMENT.md, "Total Records to Import")
+BASE_ROWS = {
+    'seasons': 9,
+    'competition_classes': 277,
+    'profiles': 4154,
+    'events': 964,
+    'memberships': 4150,
+    'competition_results': 35037,
+    'orders': 1248,
+}
+
+# Reference tables keep their size at every scale
+FIXED_TABLES = {'seasons', 'competition_classes'}
+
+# Tables whose production column order, dump-only columns included, is read
+# from the schema the production dump was taken with
+DUMP_LAYOUT_TABLES = ('profiles', 'orders')
+PRODUCTION_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'apps', 'backend', 'src', 'migrations',
+                                 'schema_baseline_20260121.sql')
+
+# Single columns the production dump has that the local schema dropped:
+# {table: [(dump position or None for last, column, type)]}
+DUMP_EXTRA_COLUMNS = {
+    'events': [(17, 'format', 'text')],
+    'competition_results': [(None, 'state_code', 'text')],
+}
+
+# FK columns by name, for schemas that do not declare them
+IMPLIED_REFERENCES = {
+    'season_id': 'seasons',
+    'event_id': 'events',
+    'class_id': 'competition_classes',
+    'competitor_id': 'profiles',
+    'user_id': 'profiles',
+    'member_id': 'profiles',
+}
+
+# Spellings as they occur in production, with their rough frequencies
+COUNTRY_VALUES = [('US', 40), ('USA', 20), ('United States', 15), ('U.S.', 3),
+                  ('united states', 2), ('Canada', 5), ('CA', 3), ('\\N', 12)]
+STATE_VALUES = [(code, 2) for code in ('FL', 'TX', 'CA', 'PA', 'OH', 'GA', 'NY', 'AL')] + \
+               [('Florida', 2), ('Texas', 1), ('ON', 1), ('\\N', 8)]
+STATUS_VALUES = {
+    'profiles.membership_status': [('active', 50), ('expired', 35), ('none', 10), ('\\N', 5)],
+    'profiles.role': [('user', 70), ('competitor', 15), ('judge', 5), ('event_director', 3),
+                      ('retailer', 4), ('admin', 1)],
+    'events.status': [('completed', 80), ('upcoming', 10), ('cancelled', 5), ('Canceled', 1),
+                      ('not_public', 4)],
+    'memberships.payment_status': [('paid', 85), ('pending', 8), ('refunded', 4), ('failed', 3)],
+    'orders.status': [('completed', 80), ('pending', 10), ('cancelled', 6), ('refunded', 4)],
+    'orders.currency': [('USD', 98), ('CAD', 2)],
+}
+WORDS = ['Bass', 'Race', 'SPL', 'Sound', 'Quality', 'Open', 'Pro', 'Street', 'Extreme',
+         'Modified', 'Master', 'Stock', 'Trunk', 'Demo', 'Park', 'Power', 'Show', 'Shine']
+NULL_RATE = 0.1
+
+# Type of a CREATE TABLE column line: what follows the name, up to the
+# column's constraints
+DDL_TYPE_RE = re.compile(
+    r'^\s*"?\w+"?\s+(.+?)(?:\s+(?:DEFAULT|NOT|NULL|COLLATE|CONSTRAINT|GENERATED|'
+    r'REFERENCES|PRIMARY|UNIQUE|CHECK)\b.*?)?,?\s*$'
+)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'import_bench_baselines.json')
+DEFAULT_TOLERANCE = 0.25
+# Phases shorter than this are timer noise and never flagged
+MIN_FLAGGED_SECONDS = 0.05
+
+
+# ---------------------------------------------------------------------------
+# Generator
+# ---------------------------------------------------------------------------
+
+def _weighted(rng, choices):
+    values = [v for v, _ in choices]
+    weights = [w for _, w in choices]
+    return lambda i: rng.choices(values, weights)[0]
+
+
+def _nullable(rng, make, rate=NULL_RATE):
+    return lambda i: '\\N' if rng.random() < rate else make(i)
+
+
+def value_generator(rng, table, column, col_type, unique, pools, references):
+    """Function i -> COPY text value for row i of a column"""
+    name = column['name'] if isinstance(column, dict) else column
+    not_null = isinstance(column, dict) and column.get('not_null')
+    key = f"{table}.{name}"
+
+    if name == 'id':
+        if col_type in ('integer', 'bigint', 'smallint'):
+            return lambda i: str(i + 1)
+        return lambda i: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    if name in references and references[name] in pools:
+        parents = pools[references[name]]
+        pick = lambda i: rng.choice(parents)
+        return pick if not_null else _nullable(rng, pick, 0.05)
+    if key in STATUS_VALUES:
+        return _weighted(rng, STATUS_VALUES[key])
+    if name.endswith('country'):
+        return _weighted(rng, COUNTRY_VALUES)
+    if name.endswith('state') and 'status' not in name:
+        return _weighted(rng, STATE_VALUES)
+    if name == 'meca_id':
+        # Unique per profile; results and memberships reuse profile numbers
+        if table == 'profiles':
+            return _nullable(rng, lambda i: str(100000 + i), 0.2)
+        members = max(1, len(pools.get('profiles', ())))
+        return _nullable(rng, lambda i: str(100000 + rng.randrange(members)), 0.2)
+    if unique:
+        return lambda i: f"{name.upper()[:3]}-{i:07d}"
+    if 'email' in name:
+        return _nullable(rng, lambda i: f"member{i}@example.com", 0.05)
+
+    base = col_type.split('(')[0]
+    if base == 'boolean':
+        make = lambda i: 't' if rng.random() < 0.3 else 'f'
+    elif base in ('integer', 'bigint', 'smallint'):
+        make = lambda i: str(rng.randint(0, 5000))
+    elif base in ('numeric', 'double precision', 'real'):
+        make = lambda i: f"{rng.uniform(0, 500):.2f}"
+    elif base.startswith('timestamp'):
+        make = lambda i: (f"20{rng.randint(15, 25):02d}-{rng.randint(1, 12):02d}-"
+                          f"{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:"
+                          f"{rng.randint(0, 59):02d}:00+00")
+    elif base == 'date':
+        make = lambda i: f"20{rng.randint(15, 25):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    elif base in ('json', 'jsonb'):
+        make = lambda i: json.dumps({'city': rng.choice(WORDS), 'country': rng.choice(['USA', 'US'])})
+    elif base == 'uuid':
+        make = lambda i: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    else:
+        make = lambda i: ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+    return make if not_null else _nullable(rng, make)
+
+
+def production_columns(schema_path, tables):
+    """{table: [(column, type)]} in the column order of the CREATE TABLEs of
+    a pg_dump schema file"""
+    layouts = {}
+    columns = None
+    with open(schema_path, 'rb') as f:
+        for line in f:
+            if columns is not None:
+                if line.lstrip().startswith(b')'):
+                    columns = None
+                    continue
+                name = dump_index.ddl_column_name(line)
+                match = DDL_TYPE_RE.match(line.decode('utf-8'))
+                if name and match:
+                    col_type = match.group(1).replace('"', '')
+                    columns.append((name, col_type.removeprefix('public.')))
+                continue
+            match = dump_index.CREATE_TABLE_RE.match(line)
+            if match and match.group(2).decode('utf-8') in tables:
+                columns = layouts[match.group(2).decode('utf-8')] = []
+    missing = [t for t in tables if t not in layouts]
+    if missing:
+        raise SystemExit(f"ERROR: no CREATE TABLE for {', '.join(missing)} in {schema_path}")
+    return layouts
+
+
+def dump_layout(metadata, table, production=None):
+    """Dump columns of a table as [(column metadata, type)] in production
+    order: the CREATE TABLE in `production` if it has the table, else the
+    local columns with the ones the production dump has and the local schema
+    lacks put back in place"""
+    local = metadata.get(table, {}).get('columns', [])
+    if production and table in production:
+        by_name = {col['name']: col for col in local}
+        return [
+            (by_name[name], by_name[name]['type']) if name in by_name
+            else ({'name': name}, col_type)
+            for name, col_type in production[table]
+        ]
+    columns = [(col, col['type']) for col in local]
+    for position, name, col_type in DUMP_EXTRA_COLUMNS.get(table, []):
+        if all(col['name'] != name for col, _ in columns):
+            if position is None:
+                position = len(columns)
+            columns.insert(min(position, len(columns)), ({'name': name}, col_type))
+    return columns
+
+
+def generate(db, out_path, scale, seed=1):
+    """Write a synthetic dump at `scale` x the production volumes"""
+    rng = random.Random(seed)
+    tables = list(TABLE_DEPENDENCIES)
+    metadata = import_schema.load_metadata(db, tables)
+    missing = [t for t in tables if t not in metadata]
+    if missing:
+        raise SystemExit(f"ERROR: tables missing from the target schema: {', '.join(missing)}")
+
+    pools = {}
+    production = production_columns(PRODUCTION_SCHEMA, DUMP_LAYOUT_TABLES)
+    layouts = {t: dump_layout(metadata, t, production) for t in tables}
+    with open(out_path, 'w', encoding='utf-8', newline='\n') as out:
+        out.write("--\n-- Synthetic dump generated by import_bench.py\n--\n\n")
+        for table in tables:
+            out.write(f"CREATE TABLE public.{table} (\n")
+            out.write(",\n".join(f"    {col['name']} {col_type}" for col, col_type in layouts[table]))
+            out.write("\n);\n\n")
+
+        # Parents first, so FK columns can point at generated rows
+        for level in _levels(tables, metadata):
+            for table in level:
+                rows = BASE_ROWS[table] if table in FIXED_TABLES else max(1, int(BASE_ROWS[table] * scale))
+                references = dict(IMPLIED_REFERENCES)
+                for fk in metadata[table]['foreign_keys']:
+                    if len(fk['columns']) == 1:
+                        references[fk['columns'][0]] = fk['ref_table']
+                unique = {cols[0] for cols in metadata[table]['unique'] if len(cols) == 1}
+                generators = [
+                    value_generator(rng, table, col, col_type, col['name'] in unique, pools, references)
+                    for col, col_type in layouts[table]
+                ]
+                names = ', '.join(col['name'] for col, _ in layouts[table])
+                id_pos = [col['name'] for col, _ in layouts[table]].index('id')
+                out.write(f"COPY public.{table} ({names}) FROM stdin;\n")
+                ids = []
+                for i in range(rows):
+                    values = [make(i) for make in generators]
+                    ids.append(values[id_pos])
+                    out.write('\t'.join(values))
+                    out.write('\n')
+                out.write("\\.\n\n\n")
+                pools[table] = ids
+                print(f"  {table}: {rows} rows")
+    print(f"Wrote {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+def _levels(tables, metadata):
+    dependencies = {t: list(TABLE_DEPENDENCIES.get(t, [])) for t in tables}
+    for table, refs in import_schema.foreign_key_dependencies(metadata, tables).items():
+        dependencies[table] += [r for r in refs if r not in dependencies[table]]
+    return dependency_levels(tables, dependencies)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def bench_table(db, metadata, reader, table, mapping, engine):
+    """Time the three phases of one table; returns {phase: seconds, ...}"""
+    result = {'rows': reader.row_count(table)}
+
+    start = time.perf_counter()
+    rows = list(reader.iter_rows(table))
+    result['extract'] = time.perf_counter() - start
+
+    normalizers = import_normalize.column_normalizers(table, reader.dump_columns(table))
+    plan = import_mapping.projection_for(mapping, normalizers)
+    if plan is not None and engine == 'columnar':
+        plan = import_columnar.ColumnarPlan(plan)
+    start = time.perf_counter()
+    transformed = list(plan.iter_apply(rows)) if plan is not None else rows
+    result['transform'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE bench_stage (LIKE public.{table} INCLUDING ALL) ON COMMIT DROP")
+        import_db.copy_rows(cur, 'bench_stage', mapping['columns'], transformed)
+        conn.rollback()
+    result['load'] = time.perf_counter() - start
+    return result
+
+
+def run(db, dump_path, engine):
+    tables = list(TABLE_DEPENDENCIES)
+    metadata = import_schema.load_metadata(db, tables)
+
+    start = time.perf_counter()
+    index = dump_index.load_index(dump_path, rebuild=True)
+    scan = time.perf_counter() - start
+    print(f"  Index scan: {scan:.2f}s ({len(index['tables'])} blocks)")
+
+    results = {'_index': {'rows': sum(i['rows'] for i in index['tables'].values()), 'extract': scan}}
+    with dump_index.DumpReader(dump_path) as reader:
+        mappings = import_mapping.mapping_plans(metadata, reader, tables, NORMALIZE_COLUMNS)
+        for table in tables:
+            if mappings.get(table) is None or not reader.row_count(table):
+                print(f"  {table}: skipped (not in dump or schema)")
+                continue
+            results[table] = bench_table(db, metadata, reader, table, mappings[table], engine)
+            r = results[table]
+            print(f"  {table:<20} rows={r['rows']:<8} "
+                  + "  ".join(f"{phase}={r[phase]:.3f}s ({_rate(r['rows'], r[phase])})"
+                              for phase in ('extract', 'transform', 'load')))
+    results['_peak_rss_mb'] = import_report.peak_rss_mb()
+    if results['_peak_rss_mb'] is not None:
+        print(f"  Peak RSS: {results['_peak_rss_mb']:.0f} MB")
+    return results
+
+
+def _rate(rows, seconds):
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "-"
+
+
+def compare(results, baseline, tolerance):
+    """Phases slower than baseline by more than tolerance: [message]"""
+    regressions = []
+    for table, phases in results.items():
+        if table.startswith('_peak') or table not in baseline:
+            continue
+        for phase in ('extract', 'transform', 'load'):
+            now, then = phases.get(phase), baseline[table].get(phase)
+            if now is None or not then or now < MIN_FLAGGED_SECONDS:
+                continue
+            if now > then * (1 + tolerance):
+                regressions.append(f"{table}.{phase}: {now:.3f}s vs baseline {then:.3f}s "
+                                   f"(+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _baseline_key(dump_path, engine):
+    return f"{os.path.basename(dump_path)}:{engine}"
+
+
+def load_baselines(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic dumps and import benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help="write a synthetic dump")
+    gen.add_argument('--scale', type=float, default=1.0,
+                     help="multiple of the production volumes (e.g. 1, 10, 100)")
+    gen.add_argument('--out', required=True, help="dump file to write")
+    gen.add_argument('--seed', type=int, default=1)
+
+    bench = sub.add_parser('run', help="benchmark the import phases on a dump")
+    bench.add_argument('--dump', required=True)
+    bench.add_argument('--engine', choices=['row', 'columnar'], default='row')
+    bench.add_argument('--baseline-file', default=BASELINE_FILE)
+    bench.add_argument('--save-baseline', action='store_true',
+                       help="store this run as the baseline for the dump and engine")
+    bench.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                       help=f"allowed slowdown before a phase is flagged (default: {DEFAULT_TOLERANCE})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db = import_db.Database(max_connections=2)
+    try:
+        if args.command == 'generate':
+            print("="*60)
+            print(f"GENERATING SYNTHETIC DUMP ({args.scale:g}x)")
+            print("="*60)
+            generate(db, args.out, args.scale, args.seed)
+            return 0
+
+        if args.engine == 'columnar' and not import_columnar.available():
+            print("WARNING: pyarrow is not installed, using the row engine")
+            args.engine = 'row'
+        print("="*60)
+        print(f"IMPORT BENCHMARK: {args.dump} (engine: {args.engine})")
+        print("="*60)
+        results = run(db, args.dump, args.engine)
+
+        baselines = load_baselines(args.baseline_file)
+        key = _baseline_key(args.dump, args.engine)
+        if args.save_baseline:
+            baselines[key] = results
+            with open(args.baseline_file, 'w', encoding='utf-8') as f:
+                json.dump(baselines, f, indent=1, sort_keys=True)
+            print(f"\nBaseline saved to {args.baseline_file} ({key})")
+            return 0
+        if key not in baselines:
+            print(f"\nNo baseline for {key} (run with --save-baseline)")
+            return 0
+        regressions = compare(results, baselines[key], args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"\nNo regressions against baseline ({key}, tolerance {args.tolerance:.0%})")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Binary COPY (PGCOPY) writer for the historical import.
+
+The transformer produces COPY text rows; with --binary-copy the rows of a
+batch are encoded into Postgres's binary COPY format using the cached column
+types of the target table (import_schema.py), so the server receives
+timestamps, numerics, uuids and jsonb ready-made instead of parsing text.
+
+Supported types: text, varchar, char, enums, json, jsonb, uuid, boolean,
+smallint, integer, bigint, real, double precision, numeric, date and
+timestamp with or without time zone. A table with any other column type is
+loaded as text. A batch with a value the encoder cannot read exactly as the
+server would (an unusual timestamp form, a timestamptz without offset,
+Infinity, ...) is sent as text instead; the server then reports any real
+errors as usual.
+"""
+
+import re
+import struct
+from datetime import date
+
+import import_schema
+
+NULL = b'\\N'
+
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+TRAILER = struct.pack('>h', -1)
+NULL_FIELD = struct.pack('>i', -1)
+
+# Postgres dates and timestamps count from 2000-01-01
+PG_EPOCH = date(2000, 1, 1).toordinal()
+
+_TIMESTAMP_RE = re.compile(
+    rb'^(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?'
+    rb'(?:([+-])(\d\d)(?::?(\d\d))?(?::?(\d\d))?)?$')
+_ESCAPE_RE = re.compile(rb'\\(?:([0-7]{1,3})|x([0-9A-Fa-f]{1,2})|(.))', re.DOTALL)
+_SIMPLE_ESCAPES = {b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t', b'v': b'\v'}
+
+
+def unescape(value):
+    """Raw bytes of a COPY text field"""
+    if b'\\' not in value:
+        return value
+    return _ESCAPE_RE.sub(_unescape_match, value)
+
+
+def _unescape_match(match):
+    octal, hexa, char = match.groups()
+    if octal is not None:
+        return bytes([int(octal, 8) & 0xFF])
+    if hexa is not None:
+        return bytes([int(hexa, 16)])
+    return _SIMPLE_ESCAPES.get(char, char)
+
+
+def _text(value):
+    return unescape(value)
+
+
+def _jsonb(value):
+    return b'\x01' + unescape(value)
+
+
+def _uuid(value):
+    raw = bytes.fromhex(value.replace(b'-', b'').decode('ascii'))
+    if len(raw) != 16:
+        raise ValueError(f"bad uuid {value!r}")
+    return raw
+
+
+def _boolean(value):
+    lowered = value.lower()
+    if lowered in (b't', b'true'):
+        return b'\x01'
+    if lowered in (b'f', b'false'):
+        return b'\x00'
+    raise ValueError(f"bad boolean {value!r}")
+
+
+def _integer(fmt, low, high):
+    pack = struct.Struct(fmt).pack
+
+    def encode(value):
+        if not value.lstrip(b'+-').isdigit():
+            raise ValueError(f"bad integer {value!r}")
+        number = int(value)
+        if not low <= number <= high:
+            raise ValueError(f"{value!r} out of range")
+        return pack(number)
+    return encode
+
+
+def _float(fmt):
+    pack = struct.Struct(fmt).pack
+
+    def encode(value):
+        if b'_' in value:
+            raise ValueError(f"bad float {value!r}")
+        return pack(float(value))
+    return encode
+
+
+def _numeric(value):
+    text = value.decode('ascii').strip()
+    if text == 'NaN':
+        return struct.pack('>hhHH', 0, 0, 0xC000, 0)
+    sign = 0
+    if text[:1] in ('+', '-'):
+        sign = 0x4000 if text[0] == '-' else 0
+        text = text[1:]
+    int_part, _, frac_part = text.partition('.')
+    if not (int_part or frac_part) or not (int_part + frac_part).isdigit():
+        raise ValueError(f"bad numeric {value!r}")
+    dscale = len(frac_part)
+    int_part = int_part.lstrip('0')
+    int_part = int_part.rjust((len(int_part) + 3) // 4 * 4, '0')
+    frac_part = frac_part.ljust((len(frac_part) + 3) // 4 * 4, '0')
+    digits = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    weight = len(digits) - 1
+    digits += [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+    while digits and digits[-1] == 0:
+        digits.pop()
+    if not digits:
+        sign, weight = 0, 0
+    return struct.pack(f'>hhHH{len(digits)}H', len(digits), weight, sign, dscale, *digits)
+
+
+def _days(year, month, day):
+    return date(year, month, day).toordinal() - PG_EPOCH
+
+
+def _date(value):
+    if len(value) != 10:
+        raise ValueError(f"bad date {value!r}")
+    return struct.pack('>i', _days(int(value[0:4]), int(value[5:7]), int(value[8:10])))
+
+
+def _timestamp(with_zone):
+    pack = struct.Struct('>q').pack
+
+    def encode(value):
+        match = _TIMESTAMP_RE.match(value)
+        if match is None:
+            raise ValueError(f"bad timestamp {value!r}")
+        year, month, day, hour, minute, second, frac, sign, oh, om, osec = match.groups()
+        seconds = (_days(int(year), int(month), int(day)) * 86400
+                   + int(hour) * 3600 + int(minute) * 60 + int(second))
+        if with_zone:
+            # Without an offset the server would apply its TimeZone setting
+            if sign is None:
+                raise ValueError(f"timestamptz without offset {value!r}")
+            offset = int(oh) * 3600 + int(om or 0) * 60 + int(osec or 0)
+            seconds -= offset if sign == b'+' else -offset
+        micros = int(frac.ljust(6, b'0')) if frac else 0
+        return pack(seconds * 1000000 + micros)
+    return encode
+
+
+ENCODERS = {
+    'text': _text,
+    'character varying': _text,
+    'character': _text,
+    'name': _text,
+    'json': _text,
+    'jsonb': _jsonb,
+    'uuid': _uuid,
+    'boolean': _boolean,
+    'smallint': _integer('>h', -(1 << 15), (1 << 15) - 1),
+    'integer': _integer('>i', -(1 << 31), (1 << 31) - 1),
+    'bigint': _integer('>q', -(1 << 63), (1 << 63) - 1),
+    'real': _float('>f'),
+    'double precision': _float('>d'),
+    'numeric': _numeric,
+    'date': _date,
+    'timestamp without time zone': _timestamp(False),
+    'timestamp with time zone': _timestamp(True),
+}
+
+
+def base_type(col_type):
+    """Formatted type without its modifier: 'timestamp(3) with time zone'
+    -> 'timestamp with time zone', 'character varying(255)' -> ..."""
+    return re.sub(r'\(\d+(?:,\d+)?\)', '', col_type)
+
+
+class BinaryEncoder:
+    """Encodes COPY text rows of one table as a binary COPY payload"""
+
+    def __init__(self, encoders):
+        self.encoders = encoders
+        self._count = struct.pack('>h', len(encoders))
+        self.fallbacks = 0
+
+    def encode(self, rows):
+        """Binary COPY data for text rows (or newline-joined blocks of
+        rows), or None if a value cannot be encoded"""
+        out = [HEADER]
+        append = out.append
+        pack_length = struct.Struct('>i').pack
+        width = len(self.encoders)
+        try:
+            for block in rows:
+                for row in block.split(b'\n'):
+                    fields = row.split(b'\t')
+                    if len(fields) != width:
+                        raise ValueError(f"expected {width} fields, got {len(fields)}")
+                    append(self._count)
+                    for value, encode in zip(fields, self.encoders):
+                        if value == NULL:
+                            append(NULL_FIELD)
+                        else:
+                            payload = encode(value)
+                            append(pack_length(len(payload)))
+                            append(payload)
+        except (ValueError, OverflowError, UnicodeDecodeError, struct.error):
+            self.fallbacks += 1
+            return None
+        append(TRAILER)
+        return b''.join(out)
+
+
+def encoder_for(metadata, table_name, col_list):
+    """(BinaryEncoder or None, [unsupported 'column type'])"""
+    types = import_schema.column_types(metadata, table_name)
+    enums = import_schema.enum_columns(metadata, table_name)
+    encoders = []
+    unsupported = []
+    for col in col_list:
+        col_type = types.get(col)
+        encode = _text if col in enums else ENCODERS.get(base_type(col_type or ''))
+        if encode is None:
+            unsupported.append(f"{col} {col_type}")
+        encoders.append(encode)
+    if unsupported:
+        return None, unsupported
+    return BinaryEncoder(encoders), []
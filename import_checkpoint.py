@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Checkpoint journal for resumable historical imports.
+
+Tables are committed in batches; after each commit the importer appends the
+batch's offsets in the dump to .import_cache/checkpoint.jsonl, and once a
+table is done it appends a "done" record. A batch that fails is journaled as
+a failed range and the table carries on with the next batch. `--resume`
+replays the journal: finished tables are skipped, failed ranges are retried
+and unfinished tables continue after their last committed batch instead of
+re-reading and re-COPYing from the start.
+
+The journal is tied to the dump it was written for (path, size, mtime); a
+journal for a different or modified dump is ignored. A batch that committed
+but crashed before its record was written is simply sent again, which the
+importer's ON CONFLICT DO NOTHING makes harmless.
+
+An --atomic run keeps its checkpoint in memory only (journal=False): its
+batches are not committed until the end, so journaling them would let a
+later --resume skip rows that were rolled back.
+"""
+
+import json
+import os
+import threading
+
+from import_schema import CACHE_DIR
+
+CHECKPOINT_FILE = os.path.join(CACHE_DIR, 'checkpoint.jsonl')
+
+
+def dump_identity(dump_path):
+    """What a journal is valid for: the dump's path, size and mtime"""
+    st = os.stat(dump_path)
+    return {
+        'dump': os.path.abspath(dump_path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+    }
+
+
+class Checkpoint:
+    """Append-only journal of committed and failed batches and finished tables"""
+
+    def __init__(self, dump_path, resume=False, path=None, journal=True):
+        self.path = path or CHECKPOINT_FILE
+        self.journal = journal
+        self.identity = dump_identity(dump_path)
+        self.offsets = {}
+        self.rows = {}
+        self.failed = {}
+        self.done = set()
+        self._lock = threading.Lock()
+
+        if not journal:
+            return
+        if resume and not self._replay():
+            print("  No usable checkpoint for this dump, starting from scratch")
+        if not resume or not (self.offsets or self.failed or self.done):
+            self._start()
+
+    def _replay(self):
+        """Load the journal; False if it is missing or for another dump"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+        try:
+            header = json.loads(lines[0]) if lines else None
+        except ValueError:
+            header = None
+        if header != self.identity:
+            return False
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash mid-write
+                break
+            self._apply(entry)
+        return True
+
+    def _apply(self, entry):
+        table = entry['table']
+        event = entry['event']
+        if event == 'chunk':
+            self.offsets[table] = max(entry['offset'], self.offsets.get(table, 0))
+            self.rows[table] = self.rows.get(table, 0) + entry['rows']
+        elif event == 'failed':
+            self.offsets[table] = max(entry['offset'], self.offsets.get(table, 0))
+            self.failed.setdefault(table, []).append((entry['start'], entry['offset']))
+        elif event == 'retried':
+            ranges = self.failed.get(table, [])
+            if (entry['start'], entry['offset']) in ranges:
+                ranges.remove((entry['start'], entry['offset']))
+        elif event == 'done':
+            self.done.add(table)
+
+    def _start(self):
+        """Begin a fresh journal for this dump"""
+        self.offsets.clear()
+        self.rows.clear()
+        self.failed.clear()
+        self.done.clear()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.identity) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append(self, entry):
+        with self._lock:
+            if self.journal:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._apply(entry)
+
+    def is_done(self, table_name):
+        return table_name in self.done
+
+    def resume_offset(self, table_name):
+        """Dump offset to continue a table from (past its last committed or
+        failed batch), or None to start fresh"""
+        return self.offsets.get(table_name)
+
+    def failed_ranges(self, table_name):
+        """(start, end) dump offsets of batches that failed and were not
+        retried successfully yet"""
+        return list(self.failed.get(table_name, []))
+
+    def rows_committed(self, table_name):
+        """Dump rows of a table committed so far, this run included"""
+        return self.rows.get(table_name, 0)
+
+    def record_chunk(self, table_name, start, offset, rows):
+        """Record a committed batch spanning dump offsets start..offset"""
+        self._append({'table': table_name, 'event': 'chunk',
+                      'start': start, 'offset': offset, 'rows': rows})
+
+    def record_failed(self, table_name, start, offset, rows):
+        """Record a batch that rolled back, to be retried by --resume"""
+        self._append({'table': table_name, 'event': 'failed',
+                      'start': start, 'offset': offset, 'rows': rows})
+
+    def record_retried(self, table_name, start, offset):
+        """Record that a failed range has been re-run (any batch of it that
+        failed again has its own failed record)"""
+        self._append({'table': table_name, 'event': 'retried',
+                      'start': start, 'offset': offset})
+
+    def record_done(self, table_name):
+        self._append({'table': table_name, 'event': 'done'})
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Columnar (Arrow) transform engine for the historical import.
+
+Parses a batch of COPY text rows into Arrow columns in one call, applies a
+ProjectionPlan (import_transform.py) as column selection, normalizes each
+normalized column once per distinct value (dictionary encoding), and writes
+the result back as COPY text. Per-row Python work disappears; only the
+distinct values of normalized columns are looked at in Python.
+
+COPY text maps onto CSV with tab delimiter and no quoting or escaping: COPY
+escapes tabs, newlines and backslashes itself, so fields are read and written
+verbatim (\\N stays the two characters \\N). Every column is read as a string.
+
+Optional: requires pyarrow. Without it, or for a batch Arrow cannot parse
+(ragged rows, invalid UTF-8), the row engine is used.
+"""
+
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+NULL = '\\N'
+
+# Bytes of COPY text handed on per yielded block
+OUTPUT_BLOCK_BYTES = 1 << 20
+
+
+def available():
+    return pa is not None
+
+
+class ColumnarPlan:
+    """Batch-at-a-time ProjectionPlan on Arrow columns, with row fallback"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.sources = plan.sources
+        self.width = plan.width
+        self.normalizers = plan.normalizers
+        names = [f"c{i}" for i in range(self.width)]
+        self._read_options = pacsv.ReadOptions(column_names=names, block_size=1 << 22)
+        self._parse_options = pacsv.ParseOptions(
+            delimiter='\t', quote_char=False, escape_char=False, double_quote=False)
+        # Only columns the plan reads are converted; skipped ones are just split
+        self._used = sorted({src for src in self.sources if src is not None})
+        self._convert_options = pacsv.ConvertOptions(
+            column_types={names[i]: pa.string() for i in self._used},
+            include_columns=[names[i] for i in self._used],
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        )
+        self._write_options = pacsv.WriteOptions(
+            include_header=False, delimiter='\t', quoting_style='none')
+
+    def apply_block(self, rows):
+        """COPY text (newline terminated) for a batch of dump rows (bytes)"""
+        data = b'\n'.join(rows) + b'\n'
+        table = pacsv.read_csv(
+            io.BytesIO(data),
+            read_options=self._read_options,
+            parse_options=self._parse_options,
+            convert_options=self._convert_options,
+        )
+        columns = {idx: table.column(pos) for pos, idx in enumerate(self._used)}
+        for idx, code_table in self.normalizers:
+            if idx in columns:
+                columns[idx] = _normalize_column(columns[idx], code_table)
+
+        fill = None
+        output = []
+        for src in self.sources:
+            if src is None:
+                if fill is None:
+                    fill = pa.array([NULL] * table.num_rows, pa.string())
+                output.append(fill)
+            else:
+                output.append(columns[src])
+        result = pa.Table.from_arrays(output, names=[f"o{i}" for i in range(len(output))])
+
+        out = io.BytesIO()
+        pacsv.write_csv(result, out, write_options=self._write_options)
+        return out.getvalue()
+
+    def apply(self, row):
+        return self.plan.apply(row)
+
+    def iter_apply(self, rows):
+        """Project a batch of rows. Yields COPY text in blocks of whole rows
+        (no trailing newline), which RowStream streams like single rows."""
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return
+        try:
+            data = self.apply_block(rows)
+        except (pa.ArrowInvalid, UnicodeDecodeError):
+            yield from self.plan.iter_apply(rows)
+            return
+        pos = 0
+        end = len(data) - 1  # drop the final newline
+        while pos < end:
+            cut = data.rfind(b'\n', pos, pos + OUTPUT_BLOCK_BYTES)
+            if cut <= pos:
+                cut = data.find(b'\n', pos + OUTPUT_BLOCK_BYTES)
+                if cut < 0 or cut > end:
+                    cut = end
+            yield data[pos:cut]
+            pos = cut + 1
+
+
+def _normalize_column(column, code_table):
+    """Apply a CodeTable to a string column once per distinct value"""
+    chunks = []
+    for chunk in column.chunks:
+        encoded = pc.dictionary_encode(chunk)
+        values = encoded.dictionary.to_pylist()
+        mapped = [code_table[v.encode('utf-8')].decode('utf-8') for v in values]
+        if mapped == values:
+            chunks.append(chunk)
+            continue
+        mapped = pa.array(mapped, pa.string())
+        chunks.append(mapped.take(encoded.indices))
+    return pa.chunked_array(chunks, pa.string())
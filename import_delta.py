@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Delta filtering for the historical import.
+
+In delta mode the primary keys already in a target table are pulled once, with
+COPY (SELECT pk ...) TO STDOUT so they arrive in exactly the text form the dump
+uses, and dump rows whose key is already present are dropped in the streaming
+pass instead of being sent over the wire and discarded by ON CONFLICT.
+
+Up to BLOOM_THRESHOLD keys are held in a set (exact). Above that they go into
+a Bloom filter; its positives may be false, so the positives of each chunk are
+checked against the table in one batched query before being dropped, on the
+caller's connection (the loader's session) so no second connection is taken
+from the pool.
+"""
+
+import hashlib
+import math
+from operator import itemgetter
+
+# Existing keys above which a Bloom filter replaces the exact set
+BLOOM_THRESHOLD = 1_000_000
+BLOOM_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over bytes keys (double hashing on blake2b)"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class _KeyCollector:
+    """File-like sink for COPY TO STDOUT that adds each line to a key set"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self._tail = b''
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        lines = (self._tail + data).split(b'\n')
+        self._tail = lines.pop()
+        add = self.keys.add
+        for line in lines:
+            add(line)
+
+    def close(self):
+        if self._tail:
+            self.keys.add(self._tail)
+            self._tail = b''
+
+
+class DeltaFilter:
+    """Drops dump rows whose primary key already exists in the target table"""
+
+    def __init__(self, db, table_name, key_columns, key_types, key_sources):
+        # key_sources: dump column index of each key column, in key order
+        self.db = db
+        self.table_name = table_name
+        self.key_columns = list(key_columns)
+        self.key_types = list(key_types)
+        self.skipped = 0
+        self.verified = 0
+
+        keys_sql = ', '.join(self.key_columns)
+        self.existing = db.query_value(f"SELECT COUNT(*) FROM public.{table_name}")
+        if self.existing > BLOOM_THRESHOLD:
+            self.keys = BloomFilter(self.existing)
+            self.exact = False
+        else:
+            self.keys = set()
+            self.exact = True
+        if self.existing:
+            sink = _KeyCollector(self.keys)
+            with db.connection() as conn, conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY (SELECT {keys_sql} FROM public.{table_name}) TO STDOUT", sink)
+            sink.close()
+
+        if list(key_sources) == [0]:
+            self._key = _first_field
+        else:
+            getter = itemgetter(*key_sources)
+            if len(key_sources) == 1:
+                self._key = lambda row: getter(row.split(b'\t'))
+            else:
+                self._key = lambda row: b'\t'.join(getter(row.split(b'\t')))
+
+    def filter(self, rows, conn=None):
+        """The rows of a chunk whose key is not in the table yet; Bloom
+        positives are checked on conn (default: a pooled connection)"""
+        if not self.existing:
+            return rows
+        key = self._key
+        keys = self.keys
+        fresh = []
+        maybe = []
+        for row in rows:
+            if key(row) in keys:
+                maybe.append(row)
+            else:
+                fresh.append(row)
+        if maybe and not self.exact:
+            present = self._present([key(row) for row in maybe], conn)
+            self.verified += len(maybe)
+            fresh += [row for row in maybe if key(row) not in present]
+            maybe = [row for row in maybe if key(row) in present]
+        self.skipped += len(maybe)
+        return fresh
+
+    def _present(self, candidates, conn=None):
+        """Which of the candidate keys (COPY text) really exist, in one query"""
+        if conn is None:
+            with self.db.connection() as pooled:
+                return self._present(candidates, pooled)
+        columns = [[] for _ in self.key_columns]
+        for key in candidates:
+            for i, value in enumerate(key.split(b'\t')):
+                columns[i].append(value.decode('utf-8'))
+        keys_sql = ', '.join(self.key_columns)
+        text_sql = ', '.join(f"{col}::text" for col in self.key_columns)
+        unnest = ', '.join(f"%s::{t}[]" for t in self.key_types)
+        sql = f"""
+            SELECT {text_sql} FROM public.{self.table_name}
+            WHERE ({keys_sql}) IN (SELECT * FROM unnest({unnest}))
+        """
+        with conn, conn.cursor() as cur:
+            cur.execute(sql, columns)
+            return {'\t'.join(row).encode('utf-8') for row in cur.fetchall()}
+
+
+def _first_field(row):
+    tab = row.find(b'\t')
+    return row if tab < 0 else row[:tab]
+
+
+def key_sources(col_list, plan, key_columns):
+    """Dump column index of each key column, or None if one is not loaded"""
+    sources = []
+    for col in key_columns:
+        if col not in col_list:
+            return None
+        pos = col_list.index(col)
+        src = plan.sources[pos] if plan is not None else pos
+        if src is None:
+            return None
+        sources.append(src)
+    return sources
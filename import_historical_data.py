@@ -5,9 +5,10 @@ This script transforms the data to fit the current schema without modifying it.
 """
 
 import subprocess
-import re
 import sys
 
+import dump_index
+
 DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
 DOCKER_CMD = ["docker", "exec", "-i", "supabase_db_NewMECAV2", "psql", "-U", "postgres", "-d", "postgres"]
 
@@ -39,18 +40,11 @@ def run_psql(sql):
     return True
 
 def extract_copy_data(table_name):
-    """Extract COPY data for a table from the dump file"""
-    with open(DUMP_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Find the COPY statement and data
-    pattern = rf'COPY {table_name} FROM stdin;\n(.*?)\n\\.'
-    match = re.search(pattern, content, re.DOTALL)
-    if not match:
+    """Extract COPY data for a table via the dump index (no full re-read)"""
+    data = dump_index.extract_copy_data(DUMP_FILE, table_name)
+    if data is None:
         print(f"No data found for table {table_name}")
-        return None
-
-    return match.group(1)
+    return data
 
 def transform_row(row, skip_indices):
     """Transform a row by removing columns at skip_indices"""
@@ -4,18 +4,161 @@ Historical Data Import Script - Final Version
 Imports data from dump_production.sql with proper transformations:
 - Skips extra columns where needed
 - Reorders columns for events
-- Normalizes country codes to ISO standards
-- Uses ON CONFLICT DO NOTHING to preserve existing data
+- Normalizes countries, US states and status enums (import_normalize.py)
+- Uses ON CONFLICT DO NOTHING to preserve existing data, or with --upsert
+  updates existing rows that changed (import_upsert.py)
+
+Columns are mapped by name from the dump's own column order onto the live
+schema (import_mapping.py); the index-based TABLE_CONFIGS are only used when
+the dump does not name a table's columns.
+
+Rows are read from a memory-mapped dump and transformed as bytes; only the
+fields a transform touches are decoded. Transformed rows are streamed into
+COPY in chunks as they are produced, so reading, transforming and loading
+overlap and no table is ever held in memory as a whole.
+
+Connects directly to Postgres through import_db (set IMPORT_DATABASE_URL;
+defaults to the local supabase database on port 54322). Tables whose
+dependencies have finished load concurrently on separate connections.
+
+Table metadata (columns, keys, FKs) comes from a cache keyed by the applied
+MikroORM migrations (import_schema.py), so an unchanged schema costs no
+catalog queries.
+
+Each table is loaded in batches of --batch-size dump rows, each COPYed into a
+per-session staging table and merged in its own transaction, so client and
+server memory stay bounded and a bad batch only loses that batch. Every batch
+is recorded in a checkpoint journal (import_checkpoint.py); --resume skips
+finished tables, retries failed batches and continues the others after their
+last committed batch.
+
+A batch that fails on bad data is bisected inside savepoints until the
+offending rows are isolated (import_rejects.py); they are written with the
+Postgres error and failing column to .import_cache/rejects/<table>.jsonl and
+the rest of the batch is loaded. Rows that would clash on a non-primary
+unique constraint (meca_id, order_number, ...) with an existing row or an
+earlier dump row are caught client-side before they are sent
+(import_unique.py) and go to the same reject file.
+
+--engine columnar transforms each batch as Arrow columns instead of row by
+row (import_columnar.py, needs pyarrow). --remap server does no row work in
+Python at all: rows are COPYed verbatim into a staging table in the dump's
+layout and one INSERT ... SELECT skips, reorders, casts and normalizes them
+(import_remap.py).
+
+--binary-copy encodes the transformed rows of the given tables as binary
+COPY from the cached column types (import_binary.py), so the server does not
+parse timestamps, numerics, uuids and JSON from text; tables with other
+types, and batches with values the encoder cannot read, are sent as text.
+
+With --delta the existing primary keys of each table are fetched once and
+rows already present are dropped while streaming (import_delta.py), so a
+resync only sends new rows.
+
+--bulk stages batches in a bare temp table (the loaded columns only, no
+indexes or constraints) instead of LIKE ... INCLUDING ALL, so each row
+maintains only the target's indexes; --defer-indexes also drops the target's
+secondary indexes while a table loads and rebuilds them in parallel when it
+is done (import_indexes.py). For large first-time loads.
+
+With --sidecar the dump-only columns of the tables in SIDECAR_TABLES (orders:
+subtotal, tax, currency, billing_address, ...) are captured in the same pass
+into a sidecar table keyed by primary key, with JSON columns parsed once into
+plain columns (import_sidecar.py).
+
+--atomic runs all tables in one session and one transaction with
+deferrable constraints deferred; before commit every foreign key of the
+loaded tables is checked with one set-based anti-join, and any failed table
+or dangling reference rolls the whole run back (import_atomic.py).
+
+--dry-run checks every transformed row against the target column types from
+the schema cache in parallel worker processes (one per core unless --jobs
+is given), without writing anything, and reports failures per column with
+sample rows (import_validate.py).
+
+Every run writes a JSON report (import_report.py) with per-table bytes and
+rows read, transformed, rejected, inserted and skipped, the time spent in
+read/filter/transform/network/server and peak memory; --progress shows a live
+progress line with ETA.
+
+The dump may be gzip, bzip2, xz or zstd compressed (--dump, --dump-format);
+it is stream-decompressed, never expanded to disk (dump_index.py).
+
+Usage:
+    python import_historical_final.py [--dump PATH] [--dump-format FORMAT]
+                                      [--jobs N] [--deps declared|catalog]
+                                      [--batch-size N] [--refresh-schema]
+                                      [--resume] [--delta] [--upsert [changed|newer]]
+                                      [--engine row|columnar]
+                                      [--remap client|server] [--binary-copy TABLES]
+                                      [--bulk] [--defer-indexes] [--atomic] [--sidecar] [--dry-run]
+                                      [--report PATH] [--progress]
 """
 
-import subprocess
-import re
+import argparse
+import json
 import sys
+import threading
+import time
+
+import dump_index
+import import_atomic
+import import_binary
+import import_checkpoint
+import import_columnar
+import import_db
+import import_delta
+import import_indexes
+import import_mapping
+import import_normalize
+import import_rejects
+import import_remap
+import import_report
+import import_scheduler
+import import_sidecar
+import import_schema
+import import_transform
+import import_unique
+import import_upsert
+import import_validate
 
 DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
-DOCKER_CMD = ["docker", "exec", "-i", "supabase_db_NewMECAV2", "psql", "-U", "postgres", "-d", "postgres"]
 
-# Table configurations
+# Dump rows per committed (and checkpointed) batch
+DEFAULT_BATCH_SIZE = 20000
+
+# Tables loaded concurrently unless --jobs is given
+DEFAULT_JOBS = 3
+
+# Columns normalized by name when mapping by name (dump column -> field type)
+# (field types are the vocabularies of import_normalize.py)
+NORMALIZE_COLUMNS = {
+    'profiles': {
+        'billing_country': 'country',
+        'shipping_country': 'country',
+        'country': 'country',
+        'billing_state': 'us_state',
+        'shipping_state': 'us_state',
+        'state': 'us_state',
+        'membership_status': 'membership_status',
+        'role': 'user_role',
+    },
+    'events': {
+        'venue_country': 'country',
+        'venue_state': 'us_state',
+        'status': 'event_status',
+    },
+    'memberships': {
+        'billing_country': 'country',
+        'billing_state': 'us_state',
+        'payment_status': 'payment_status',
+    },
+    'orders': {
+        'status': 'order_status',
+    },
+}
+
+# Fallback table configurations, used only when the dump has no column names
 # skip_indices: dump column indices to skip (0-based)
 # column_reorder: map from dump index (after skip) to local index (for events only)
 TABLE_CONFIGS = {
@@ -85,207 +228,656 @@ TABLE_CONFIGS = {
         'num_local_cols': 22,
     },
     'orders': {
-        'skip_indices': [],
+        'skip_indices': list(range(13, 26)),  # order_items .. shop_order_reference
         'column_reorder': None,
-        'num_local_cols': 26,
+        'num_local_cols': 13,
     },
 }
 
-# ISO Country normalization
-COUNTRY_NORMALIZE = {
-    'USA': 'US',
-    'United States': 'US',
-    'U.S.A.': 'US',
-    'U.S.': 'US',
-    'united states': 'US',
-    'usa': 'US',
+# Dump-only columns captured into sidecar tables with --sidecar
+# (import_sidecar.py). json: {dump column: {sidecar column: JSON key(s) or
+# {'keys': ..., 'normalize': import_normalize resolver}}}
+SIDECAR_TABLES = {
+    'orders': {
+        'table': 'orders_dump_extra',
+        'json': {
+            'billing_address': {
+                'billing_name': 'name',
+                'billing_email': 'email',
+                'billing_phone': 'phone',
+                'billing_street': ('street', 'address', 'line1', 'address1'),
+                'billing_city': 'city',
+                'billing_state': {'keys': ('state', 'region'), 'normalize': 'us_state'},
+                'billing_postal_code': ('zip', 'postal_code', 'postalCode', 'zipCode'),
+                'billing_country': {'keys': 'country', 'normalize': 'country'},
+            },
+        },
+    },
 }
 
+# FK dependencies between the imported tables (--deps declared).
+# Key order is the import order used to break ties.
+TABLE_DEPENDENCIES = {
+    'seasons': [],                  # No dependencies
+    'competition_classes': ['seasons'],
+    'profiles': [],                 # No dependencies
+    'events': ['seasons'],
+    'memberships': ['profiles'],
+    'competition_results': ['events', 'profiles', 'competition_classes'],
+    'orders': ['profiles'],
+}
 
-def run_psql(sql, description=""):
-    """Run SQL command via psql in docker"""
-    if description:
-        print(f"  {description}...")
-    proc = subprocess.run(
-        DOCKER_CMD,
-        input=sql.encode('utf-8'),
-        capture_output=True
-    )
-    if proc.returncode != 0:
-        error = proc.stderr.decode('utf-8')
-        if error.strip():
-            print(f"  ERROR: {error[:500]}")
-        return False, error
-    output = proc.stdout.decode('utf-8')
-    return True, output
-
-
-def extract_copy_data(table_name):
-    """Extract COPY data for a table from the dump file"""
-    with open(DUMP_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    pattern = rf'COPY {table_name} FROM stdin;\n(.*?)\n\\.'
-    match = re.search(pattern, content, re.DOTALL)
-    if match:
-        return match.group(1)
-    return None
-
-
-def normalize_country(value):
-    """Normalize country code to ISO standard"""
-    if value in COUNTRY_NORMALIZE:
-        return COUNTRY_NORMALIZE[value]
-    return value
-
-
-def transform_row(row, config):
-    """Transform a row based on configuration"""
-    columns = row.split('\t')
-    skip_indices = config.get('skip_indices', [])
-    column_reorder = config.get('column_reorder')
-    num_local_cols = config.get('num_local_cols', len(columns))
-    iso_normalize = config.get('iso_normalize', {})
-
-    # First, apply ISO normalization to original columns
-    for col_idx, field_type in iso_normalize.items():
-        if col_idx < len(columns) and field_type == 'country':
-            columns[col_idx] = normalize_country(columns[col_idx])
-
-    # Remove skipped columns
-    filtered = [col for i, col in enumerate(columns) if i not in skip_indices]
-
-    # Apply reordering if specified
-    if column_reorder:
-        output = ['\\N'] * num_local_cols
-        for src_idx, dst_idx in column_reorder.items():
-            if src_idx < len(filtered):
-                output[dst_idx] = filtered[src_idx]
-        return '\t'.join(output)
-    else:
-        return '\t'.join(filtered)
+_print_lock = threading.Lock()
 
 
-def get_local_columns(table_name):
-    """Get column names from local database"""
-    sql = f"""
-    SELECT string_agg(column_name, ', ' ORDER BY ordinal_position)
-    FROM information_schema.columns
-    WHERE table_schema = 'public' AND table_name = '{table_name}';
-    """
-    success, output = run_psql(sql)
-    if not success:
-        return None
-    lines = output.strip().split('\n')
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('-') and not line.startswith('string_agg') and not line.startswith('('):
-            return line
-    return None
+class TableLog:
+    """Collects a table's progress lines so that tables loading in parallel
+    print as whole blocks instead of interleaving"""
 
+    def __init__(self):
+        self.lines = []
 
-def import_table(table_name):
-    """Import data for a table"""
-    print(f"\n{'='*60}")
-    print(f"Importing {table_name}...")
-    print(f"{'='*60}")
+    def __call__(self, message=""):
+        self.lines.append(message)
 
-    config = TABLE_CONFIGS.get(table_name, {})
+    def flush(self):
+        with _print_lock:
+            print('\n'.join(self.lines))
+        self.lines = []
 
-    # Extract data from dump
-    data = extract_copy_data(table_name)
-    if data is None:
-        print(f"  No data found for {table_name}")
-        return False, 0
 
-    lines = data.strip().split('\n')
-    original_count = len(lines)
-    print(f"  Found {original_count} rows in dump")
+def resolve_columns(metadata, reader, table_name, mapping, log):
+    """Local columns to COPY and the projection plan that feeds them.
 
-    # Transform rows
-    skip_indices = config.get('skip_indices', [])
-    if skip_indices or config.get('column_reorder') or config.get('iso_normalize'):
-        print(f"  Transforming data (skip: {skip_indices}, reorder: {bool(config.get('column_reorder'))}, iso: {bool(config.get('iso_normalize'))})")
-        transformed = [transform_row(line, config) for line in lines]
-    else:
-        print(f"  Direct import (no transformation)")
-        transformed = lines
+    Uses the name-based mapping when there is one, else the index-based
+    TABLE_CONFIGS. Returns (columns, plan or None), or None on error.
+    """
+    if mapping is not None:
+        log(f"  Target: {len(mapping['columns'])} columns (mapped by name)")
+        if mapping['skipped']:
+            log(f"  Skipping dump columns: {', '.join(mapping['skipped'])}")
+        if mapping['defaulted']:
+            log(f"  Defaulted local columns: {', '.join(mapping['defaulted'])}")
+        normalizers = import_normalize.column_normalizers(
+            table_name, reader.dump_columns(table_name))
+        plan = import_mapping.projection_for(mapping, normalizers)
+        if plan is not None:
+            log(f"  Transforming data (projection by name, {len(mapping['normalize'])} normalized columns)")
+        else:
+            log("  Direct import (no transformation)")
+        return mapping['columns'], plan
 
-    transformed_data = '\n'.join(transformed)
+    config = TABLE_CONFIGS.get(table_name, {})
 
     # Get local column list
-    columns = get_local_columns(table_name)
-    if not columns:
-        print(f"  ERROR: Could not get columns for {table_name}")
-        return False, 0
+    col_list = import_schema.column_names(metadata, table_name)
+    if not col_list:
+        log(f"  ERROR: Could not get columns for {table_name}")
+        return None
 
-    num_cols = len(columns.split(', '))
-    print(f"  Target: {num_cols} columns")
+    log(f"  Target: {len(col_list)} columns")
 
     # For tables where dump has fewer cols than local (seasons)
     if table_name == 'seasons':
         # Only use first 9 columns from local
-        col_list = columns.split(', ')[:9]
-        columns = ', '.join(col_list)
-        print(f"  Using first 9 columns: {columns[:50]}...")
-
-    # Build import SQL
-    sql = f"""
-SET session_replication_role = replica;
+        col_list = col_list[:9]
+        log(f"  Using first 9 columns: {', '.join(col_list)[:50]}...")
 
-CREATE TEMP TABLE tmp_import (LIKE public.{table_name} INCLUDING ALL);
-
-COPY tmp_import ({columns}) FROM stdin;
-{transformed_data}
-\\.
-
-INSERT INTO public.{table_name} ({columns})
-SELECT {columns} FROM tmp_import
-ON CONFLICT (id) DO NOTHING;
+    skip_indices = config.get('skip_indices', [])
+    plan = import_transform.compile_plan(
+        config, reader.column_count(table_name),
+        import_normalize.column_normalizers(table_name, reader.dump_columns(table_name)))
+    if plan is not None:
+        log(f"  Transforming data (skip: {skip_indices}, reorder: {bool(config.get('column_reorder'))}, iso: {bool(config.get('iso_normalize'))})")
+    else:
+        log("  Direct import (no transformation)")
+    return col_list, plan
 
-DROP TABLE tmp_import;
 
-SET session_replication_role = DEFAULT;
+def load_table(db, metadata, reader, checkpoint, options, table_name, mapping, log,
+               stats, progress=None):
+    """Import data for a table"""
+    log(f"\n{'='*60}")
+    log(f"Importing {table_name}...")
+    log(f"{'='*60}")
+
+    # Locate data in the dump (no scan: row count comes from the index)
+    original_count = reader.row_count(table_name)
+    if not original_count:
+        log(f"  No data found for {table_name}")
+        stats.status = 'missing'
+        return False, 0
 
-SELECT COUNT(*) as total FROM public.{table_name};
-"""
+    log(f"  Found {original_count} rows in dump")
+    stats.dump_rows = original_count
+    info = reader.block_info(table_name)
 
-    success, output = run_psql(sql, "Executing import")
+    if checkpoint.is_done(table_name):
+        log("  Already imported (checkpoint), skipping")
+        stats.status = 'skipped'
+        if progress is not None:
+            progress.advance(info['data_end'] - info['data_offset'], table_name)
+        return True, original_count
 
-    if success:
-        # Parse final count
-        for line in output.strip().split('\n'):
-            line = line.strip()
-            if line.isdigit():
-                print(f"  Final count: {line}")
-                break
+    resolved = resolve_columns(metadata, reader, table_name, mapping, log)
+    if resolved is None:
+        stats.status = 'failed'
+        return False, 0
+    col_list, plan = resolved
+    remap = None
+    if options.remap == 'server':
+        if mapping is None:
+            log("  Server remap needs a name-based mapping, remapping client-side")
+        else:
+            remap = import_remap.ServerRemap(
+                metadata, table_name, mapping,
+                import_normalize.column_normalizers(table_name, reader.dump_columns(table_name)))
+            # Keys are located in the dump layout the remap reads
+            plan = remap
+            log(f"  Remapping server-side ({len(mapping['skipped'])} dump columns not selected, "
+                f"{len(remap.code_tables)} normalized)")
+    sidecar = None
+    if options.sidecar and table_name in SIDECAR_TABLES:
+        if remap is not None or plan is None or mapping is None:
+            log("  Sidecar: needs the client-side name-based mapping, not captured")
+        else:
+            sidecar = import_sidecar.Sidecar.for_table(
+                metadata, table_name, SIDECAR_TABLES[table_name],
+                reader.dump_columns(table_name), mapping['skipped'])
+        if sidecar is not None:
+            plan = import_sidecar.SidecarPlan(plan, sidecar)
+            log(f"  Sidecar: {len(sidecar.extra)} dump-only columns -> public.{sidecar.table_name}")
+    if plan is not None and remap is None and options.engine == 'columnar':
+        if sidecar is not None:
+            log("  Columnar engine: not used with sidecar capture")
+        else:
+            plan = import_columnar.ColumnarPlan(plan)
+    binary = None
+    if options.binary_copy and ('all' in options.binary_copy or table_name in options.binary_copy):
+        if remap is not None:
+            log("  Binary COPY: not used with server-side remap")
+        else:
+            binary, unsupported = import_binary.encoder_for(metadata, table_name, col_list)
+            if binary is None:
+                log(f"  Binary COPY: unsupported types ({', '.join(unsupported)}), sending text")
+            else:
+                log("  Binary COPY (typed from the cached schema)")
+    primary_key = import_schema.primary_key(metadata, table_name)
+    merge = import_upsert.Merge(metadata, table_name, col_list, options.upsert)
+    if options.upsert and merge.mode is None:
+        log("  Upsert: no loaded columns besides the primary key, inserting only")
+    elif merge.mode is not None and merge.mode != options.upsert:
+        log(f"  Upsert: no {import_upsert.VERSION_COLUMN} column, updating changed rows")
+
+    delta = None
+    if options.delta:
+        sources = import_delta.key_sources(col_list, plan, primary_key) if primary_key else None
+        if sources is None:
+            log("  Delta: no primary key in the loaded columns, sending all rows")
+        else:
+            types = import_schema.column_types(metadata, table_name)
+            delta = import_delta.DeltaFilter(
+                db, table_name, primary_key, [types[col] for col in primary_key], sources)
+            kind = "id set" if delta.exact else "Bloom filter"
+            log(f"  Delta: {delta.existing} existing keys ({kind})")
+
+    unique = import_unique.UniqueValidator(db, metadata, table_name, col_list, plan)
+    if unique.active:
+        checked = '; '.join(', '.join(columns) for columns, _ in unique.constraints)
+        log(f"  Unique pre-check: {checked}")
+
+    # Failed batches of earlier runs are retried first, then the table
+    # continues after the last batch an earlier run got through
+    passes = checkpoint.failed_ranges(table_name)
+    if passes:
+        log(f"  Retrying {len(passes)} failed batches")
+    start = checkpoint.resume_offset(table_name)
+    if start is not None:
+        log(f"  Resuming after {checkpoint.rows_committed(table_name)} committed rows")
+    if progress is not None:
+        progress.extend(sum(end - begin for begin, end in passes))
+        if start is not None:
+            progress.advance(start - info['data_offset'], table_name)
+    passes.append((start, None))
+
+    deferral = None
+    if options.defer_indexes:
+        deferral = import_indexes.IndexDeferral(db, table_name, parallel=not options.atomic)
+        with stats.timed('indexes'):
+            dropped = deferral.drop()
+        if dropped:
+            log(f"  Deferred {dropped} secondary indexes: "
+                f"{', '.join(index['name'] for index in deferral.indexes)}")
+
+    # Rows are transformed lazily and streamed into COPY as the driver reads;
+    # each batch commits on its own and is then checkpointed
+    log(f"  Streaming import (batches of {options.batch_size} rows)...")
+    inserted = 0
+    failed = 0
+    rejects = import_rejects.RejectLog(table_name, append=options.resume)
+    try:
+        with db.session() as conn:
+            with conn, conn.cursor() as cur:
+                if remap is not None:
+                    remap.create_staging(cur)
+                else:
+                    cur.execute("DROP TABLE IF EXISTS tmp_import")
+                    if options.bulk:
+                        # Only the loaded columns: no indexes, constraints or defaults
+                        cur.execute(f"""
+                            CREATE TEMP TABLE tmp_import ON COMMIT DELETE ROWS AS
+                            SELECT {', '.join(col_list)} FROM public.{table_name} WITH NO DATA
+                        """)
+                    else:
+                        cur.execute(f"""
+                            CREATE TEMP TABLE tmp_import (LIKE public.{table_name} INCLUDING ALL)
+                            ON COMMIT DELETE ROWS
+                        """)
+                if sidecar is not None:
+                    sidecar.create(cur)
+            # With nothing to filter, server remap sends the dump's bytes as
+            # they are and rows are only split if a batch needs bisecting
+            raw = remap is not None and delta is None and not unique.active
+            chunks = reader.iter_raw_chunks if raw else reader.iter_chunks
+            for range_start, range_end in passes:
+                batches = stats.timed_iter('read', chunks(
+                    table_name, options.batch_size, range_start, range_end))
+                for batch_start, batch_end, batch in batches:
+                    batch_rows = len(batch)
+                    stats.add('bytes_read', batch_end - batch_start)
+                    stats.add('rows_parsed', batch_rows)
+                    with stats.timed('filter'):
+                        if delta is not None:
+                            batch = delta.filter(batch, conn)
+                            stats.add('rows_skipped_existing', batch_rows - len(batch))
+                        staged = len(batch)
+                        batch = unique.filter(batch, rejects, batch_start)
+                        stats.add('rows_unique_conflicts', staged - len(batch))
+                    rejected_rows = ()
+                    try:
+                        if batch:
+                            loaded, rejected_rows = load_batch(
+                                conn, table_name, col_list, merge, plan, batch, rejects,
+                                batch_start, stats, remap, binary, sidecar)
+                            inserted += loaded
+                    except import_db.Error as e:
+                        # An atomic run cannot go on past a failed batch
+                        if conn.closed or options.atomic:
+                            raise
+                        failed += 1
+                        log(f"  ERROR in batch of {batch_rows} rows at offset {batch_start}: "
+                            f"{str(e).strip()[:500]}")
+                        checkpoint.record_failed(table_name, batch_start, batch_end, batch_rows)
+                    else:
+                        unique.claim(rejected_rows)
+                        checkpoint.record_chunk(table_name, batch_start, batch_end, batch_rows)
+                    if progress is not None:
+                        progress.advance(batch_end - batch_start, table_name)
+                if range_end is not None:
+                    checkpoint.record_retried(table_name, range_start, range_end)
+            with conn, conn.cursor() as cur:
+                if remap is not None:
+                    remap.drop_staging(cur)
+                else:
+                    cur.execute("DROP TABLE tmp_import")
+                if sidecar is not None:
+                    sidecar.drop_staging(cur)
+        if delta is not None:
+            log(f"  Skipped existing: {delta.skipped}")
+        for name, count in sorted(unique.conflicts.items()):
+            log(f"  Unique conflicts ({name}): {count}")
+        if sidecar is not None:
+            captured = db.query_value(f"SELECT COUNT(*) FROM public.{sidecar.table_name}")
+            log(f"  Sidecar rows: {captured} in public.{sidecar.table_name}")
+            if sidecar.parse_errors:
+                log(f"  Sidecar: {sidecar.parse_errors} JSON values could not be parsed (kept verbatim)")
+        if binary is not None and binary.fallbacks:
+            log(f"  Binary COPY: {binary.fallbacks} batch attempts sent as text")
+        if rejects.count:
+            log(f"  Rejected: {rejects.count} rows (see {rejects.path})")
+        log(f"  Inserted: {inserted}")
+        if merge.mode is not None:
+            log(f"  Updated: {stats.counters['rows_updated']}, "
+                f"unchanged: {stats.counters['rows_conflicting']}")
+        log(f"  {stats.summary()}")
+        log(f"  Final count: {db.query_value(f'SELECT COUNT(*) FROM public.{table_name}')}")
+    except import_db.Error as e:
+        log(f"  ERROR: {str(e).strip()[:500]}")
+        if checkpoint.rows_committed(table_name):
+            log(f"  {checkpoint.rows_committed(table_name)} rows committed; rerun with --resume to continue")
+        stats.status = 'failed'
+        return False, original_count
+    finally:
+        rejects.close()
+        if deferral is not None and deferral.indexes:
+            try:
+                with stats.timed('indexes'):
+                    unbuilt = deferral.rebuild(log)
+            except import_db.Error as e:
+                # Only an --atomic rebuild raises; its transaction is lost
+                log(f"  ERROR rebuilding indexes: {str(e).strip()[:500]}")
+                stats.status = 'failed'
+            else:
+                if unbuilt:
+                    log(f"  {len(unbuilt)} indexes still dropped; the next run rebuilds them")
+                log(f"  Indexes rebuilt in {stats.seconds['indexes']:.2f}s")
+
+    if stats.status == 'failed':
+        return False, original_count
+    if failed:
+        log(f"  {failed} batches failed; rerun with --resume to retry them")
+        stats.status = 'failed'
+        return False, original_count
+
+    checkpoint.record_done(table_name)
+    stats.status = 'ok'
+    return True, original_count
+
+
+def load_batch(conn, table_name, col_list, merge, plan, batch, rejects, batch_offset,
+               stats, remap=None, binary=None, sidecar=None):
+    """COPY one batch of dump rows into the session's staging table and merge
+    it (import_upsert.Merge), as one transaction; rows that fail on bad data
+    are isolated and written to rejects. With a ServerRemap the rows are staged as they are
+    and mapped by the merge; with a BinaryEncoder they are sent as binary
+    COPY; with a Sidecar the rows' dump-only columns (collected by the
+    SidecarPlan) are merged into the sidecar table too. Returns (rows
+    inserted, positions in batch of the rejected rows); rows updated are
+    counted in stats."""
+    copy_seconds = 0.0
+    updated = 0
+    started = time.perf_counter()
+    rejected = rejects.count
+
+    def load(cur, rows):
+        nonlocal copy_seconds, updated
+        if remap is not None:
+            copy_start = time.perf_counter()
+            try:
+                remap.copy(cur, rows)
+            finally:
+                copy_seconds += time.perf_counter() - copy_start
+            inserted, changed = remap.insert(cur, merge)
+            # Only reached when the attempt succeeds
+            updated += changed
+            return inserted
+        if plan is not None:
+            stats.add('rows_transformed', len(rows))
+            rows = stats.timed_iter('transform', plan.iter_apply(rows))
+        copy_start = time.perf_counter()
+        try:
+            data = None
+            if binary is not None:
+                rows = list(rows)
+                with stats.timed('transform'):
+                    data = binary.encode(rows)
+            if data is not None:
+                import_db.copy_block(cur, 'tmp_import', col_list, data, binary=True)
+            else:
+                import_db.copy_rows(cur, 'tmp_import', col_list, rows)
+        finally:
+            copy_seconds += time.perf_counter() - copy_start
+        inserted, changed = merge.run(cur, col_list, 'tmp_import')
+        cur.execute("TRUNCATE tmp_import")
+        if sidecar is not None:
+            sidecar.load(cur, plan.pending)
+        # Only reached when the attempt succeeds
+        updated += changed
+        return inserted
+
+    transform_before = stats.seconds['transform']
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("SET LOCAL session_replication_role = replica")
+            inserted, rejected_rows = import_rejects.load_isolating(
+                cur, batch, load, rejects, batch_offset,
+                locate=remap.failing_column if remap is not None else None)
+    finally:
+        # COPY pulls the transform; what remains of it is the network leg
+        streamed = stats.seconds['transform'] - transform_before
+        stats.seconds['network'] += copy_seconds - streamed
+        stats.seconds['server'] += time.perf_counter() - started - copy_seconds
+    rejected = rejects.count - rejected
+    stats.add('rows_rejected', rejected)
+    stats.add('rows_inserted', inserted)
+    stats.add('rows_updated', updated)
+    stats.add('rows_conflicting', len(batch) - rejected - inserted - updated)
+    return inserted, rejected_rows
+
+
+def import_table(db, metadata, reader, checkpoint, options, table_name, mapping=None,
+                 report=None, progress=None):
+    """Import a table, printing its progress as one block when it finishes"""
+    log = TableLog()
+    stats = (report or import_report.RunReport(reader.dump_path)).table(table_name)
+    try:
+        return load_table(db, metadata, reader, checkpoint, options, table_name, mapping, log,
+                          stats, progress)
+    finally:
+        log.flush()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import historical data from dump_production.sql")
+    parser.add_argument('--dump', metavar='PATH',
+                        help=f"dump to import, plain or compressed (default: {DUMP_FILE})")
+    parser.add_argument('--dump-format', choices=('auto',) + dump_index.FORMATS, default='auto',
+                        help="input format; auto detects compression from the file")
+    parser.add_argument('--jobs', type=int,
+                        help=f"tables to load concurrently (default: {DEFAULT_JOBS}); "
+                             "validation workers with --dry-run (default: one per core)")
+    parser.add_argument('--deps', choices=['declared', 'catalog'], default='declared',
+                        help="table dependencies: TABLE_DEPENDENCIES or the schema's FKs")
+    parser.add_argument('--refresh-schema', action='store_true',
+                        help="ignore the cached schema metadata and re-read the catalog")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from the checkpoint of a previous run")
+    parser.add_argument('--delta', action='store_true',
+                        help="only send rows whose primary key is not in the table yet")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"dump rows per committed batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--engine', choices=['row', 'columnar'], default='row',
+                        help="transform engine: per-row bytes or Arrow columns (needs pyarrow)")
+    parser.add_argument('--remap', choices=['client', 'server'], default='client',
+                        help="map columns in Python, or stage rows as they are and map in SQL")
+    parser.add_argument('--binary-copy', metavar='TABLES', default='',
+                        type=lambda value: {t.strip() for t in value.split(',') if t.strip()},
+                        help="comma-separated tables (or 'all') to send as binary COPY")
+    parser.add_argument('--upsert', nargs='?', const='changed', choices=import_upsert.MODES,
+                        help="update existing rows that changed (default) or whose "
+                             f"{import_upsert.VERSION_COLUMN} is newer, instead of skipping them")
+    parser.add_argument('--bulk', action='store_true',
+                        help="stage batches in a bare table without indexes or constraints")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="drop secondary indexes while a table loads, rebuild them after "
+                             "(implies --bulk)")
+    parser.add_argument('--atomic', action='store_true',
+                        help="import all tables in one transaction, check foreign keys "
+                             "before commit, roll everything back on any failure")
+    parser.add_argument('--sidecar', action='store_true',
+                        help="keep dump-only columns (orders) in sidecar tables, see SIDECAR_TABLES")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="validate transformed rows against the column types, write nothing")
+    parser.add_argument('--report', metavar='PATH',
+                        help="where to write the JSON run report (default: .import_cache/reports/)")
+    parser.add_argument('--progress', action='store_true',
+                        help="show a live progress line with ETA on stderr")
+    args = parser.parse_args()
+    if args.upsert and args.delta:
+        parser.error("--delta skips rows already in the table, so --upsert could never update them")
+    if args.atomic and args.resume:
+        parser.error("--atomic commits nothing until the end, so there is nothing to --resume")
+    return args
+
+
+def dry_run(args, tables, dump_path, fmt):
+    """Validate every transformed row against the cached column types, with
+    no database writes (and no connection when the schema cache is warm)"""
+    metadata = None if args.refresh_schema else import_schema.cached_metadata(tables)
+    if metadata is None:
+        db = import_db.Database(max_connections=1)
+        metadata = import_schema.load_metadata(db, tables, refresh=args.refresh_schema)
+        db.close()
+    else:
+        print("Schema: cached metadata (not checked against migrations)")
 
-    return success, original_count
+    print("\n" + "="*60)
+    print("DRY RUN: TYPE VALIDATION (nothing is written)")
+    print("="*60)
+    with dump_index.DumpReader(dump_path, fmt) as reader:
+        mappings = import_mapping.mapping_plans(metadata, reader, tables, NORMALIZE_COLUMNS)
+        start = time.perf_counter()
+        results = import_validate.validate(
+            reader, metadata, mappings, tables, resolve_columns, processes=args.jobs)
+        elapsed = time.perf_counter() - start
+    failed = import_validate.print_results(results, metadata)
+    rows = sum(result.rows for result in results.values())
+    print(f"\nValidated {rows} rows in {elapsed:.1f}s: {failed} rows would fail")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({table: result.as_dict() for table, result in results.items()}, f, indent=2)
+        print(f"Validation report: {args.report}")
+    return 1 if failed else 0
+
+
+def commit_atomic(atomic, tables):
+    """Validate the foreign keys of an --atomic run and commit it, or roll
+    it all back; returns True if committed"""
+    print("\n" + "="*60)
+    print("FOREIGN KEY VALIDATION")
+    print("="*60)
+    if atomic.failed:
+        print("  Skipped: a table failed")
+        violations = None
+    else:
+        start = time.perf_counter()
+        try:
+            violations = import_atomic.validate_foreign_keys(atomic, tables, print)
+        except import_db.Error as e:
+            print(f"  ERROR: {str(e).strip()[:500]}")
+            violations = None
+        else:
+            print(f"  Checked in {time.perf_counter() - start:.2f}s")
+    if violations == []:
+        atomic.commit()
+        print("\nCOMMITTED: all tables imported in one transaction")
+        return True
+    atomic.rollback()
+    print("\nROLLED BACK: nothing was imported")
+    return False
 
 
 def main():
+    args = parse_args()
+    args.batch_size = max(1, args.batch_size)
+    if args.engine == 'columnar' and not import_columnar.available():
+        print("WARNING: pyarrow is not installed, using the row engine")
+        args.engine = 'row'
+    jobs = 1 if args.atomic else max(1, args.jobs or DEFAULT_JOBS)
+    if args.defer_indexes:
+        args.bulk = True
     # Import order respects foreign keys
-    tables = [
-        'seasons',           # No dependencies
-        'competition_classes',  # Depends on seasons
-        'profiles',          # No dependencies
-        'events',            # Depends on seasons
-        'memberships',       # Depends on profiles
-        'competition_results',  # Depends on events, profiles, competition_classes
-        'orders',            # Depends on profiles
-    ]
+    tables = list(TABLE_DEPENDENCIES)
 
     print("="*60)
     print("HISTORICAL DATA IMPORT")
     print("="*60)
-    print(f"Source: {DUMP_FILE}")
-    print("Mode: ON CONFLICT DO NOTHING (preserves existing data)")
+    dump_path = args.dump or DUMP_FILE
+    fmt = None if args.dump_format == 'auto' else args.dump_format
+    print(f"Source: {dump_path}")
+    if args.upsert == 'newer':
+        print(f"Mode: upsert (updates existing rows with a newer {import_upsert.VERSION_COLUMN})")
+    elif args.upsert:
+        print("Mode: upsert (updates existing rows that changed)")
+    else:
+        print("Mode: ON CONFLICT DO NOTHING (preserves existing data)")
+    if args.delta:
+        print("Delta: rows with existing primary keys are not sent")
+    if args.remap == 'server':
+        print("Remap: rows staged in dump layout, mapped by INSERT ... SELECT")
+    if args.atomic:
+        print("Atomic: one transaction for all tables, foreign keys checked before commit")
+    if args.bulk:
+        print("Bulk: unindexed staging"
+              + (", secondary indexes rebuilt after each table" if args.defer_indexes else ""))
+
+    if args.dry_run:
+        return dry_run(args, tables, dump_path, fmt)
+
+    # One connection per concurrent table plus one for metadata queries
+    db = import_db.Database(max_connections=jobs + 1)
+    metadata = import_schema.load_metadata(db, tables, refresh=args.refresh_schema)
+    if args.deps == 'catalog':
+        dependencies = import_schema.foreign_key_dependencies(metadata, tables)
+    else:
+        dependencies = TABLE_DEPENDENCIES
+    levels = import_scheduler.dependency_levels(tables, dependencies)
+    print(f"Jobs: {jobs}")
+    for i, level in enumerate(levels, 1):
+        print(f"  Level {i}: {', '.join(level)}")
     print()
 
-    results = {}
-    for table in tables:
-        success, count = import_table(table)
-        results[table] = {'success': success, 'dump_count': count}
+    checkpoint = import_checkpoint.Checkpoint(
+        dump_path, resume=args.resume, journal=not args.atomic)
+    if checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} tables already imported")
+        print()
+
+    # Indexes an interrupted --defer-indexes run left dropped are rebuilt
+    # now, unless their table is about to be bulk-loaded again
+    reloading = {t for t in tables if not checkpoint.is_done(t)} if args.defer_indexes else set()
+    if import_indexes.pending().keys() - reloading:
+        import_indexes.restore_pending(db, print, skip=reloading)
+        print()
+
+    report = import_report.RunReport(dump_path, args)
+    atomic = import_atomic.AtomicDatabase(db) if args.atomic else None
+
+    def load(table):
+        if atomic is None:
+            return import_table(db, metadata, reader, checkpoint, args, table,
+                                mappings.get(table), report, progress)
+        if atomic.failed:
+            log = TableLog()
+            log(f"\nSkipping {table}: an earlier table failed, the run will be rolled back")
+            log.flush()
+            return False, reader.row_count(table)
+        outcome = import_table(atomic, metadata, reader, checkpoint, args, table,
+                               mappings.get(table), report, progress)
+        if report.table(table).status == 'failed':
+            atomic.failed = True
+        return outcome
+
+    with dump_index.DumpReader(dump_path, fmt) as reader:
+        if reader.format != 'plain':
+            print(f"Input: {reader.format}-compressed, stream-decompressed")
+        mappings = import_mapping.mapping_plans(metadata, reader, tables, NORMALIZE_COLUMNS)
+        progress = None
+        if args.progress:
+            blocks = [reader.block_info(table) for table in tables]
+            progress = import_report.Progress(
+                sum(b['data_end'] - b['data_offset'] for b in blocks if b))
+        try:
+            outcomes = import_scheduler.run_schedule(tables, dependencies, load, jobs)
+        except BaseException:
+            if atomic is not None:
+                atomic.rollback()
+            raise
+        if progress is not None:
+            progress.finish()
+
+    rolled_back = False
+    if atomic is not None:
+        rolled_back = not commit_atomic(atomic, tables)
+        if rolled_back:
+            for table in tables:
+                if report.table(table).status == 'ok':
+                    report.table(table).status = 'rolled_back'
+    results = {
+        table: {'success': outcomes[table][0], 'dump_count': outcomes[table][1]}
+        for table in tables
+    }
 
     # Summary
     print("\n" + "="*60)
@@ -294,6 +886,8 @@ def main():
 
     for table, result in results.items():
         status = "OK" if result['success'] else "FAILED"
+        if rolled_back and result['success']:
+            status = "ROLLED BACK"
         print(f"  {table}: {result['dump_count']} rows [{status}]")
 
     # Final counts
@@ -311,10 +905,24 @@ def main():
     UNION ALL SELECT 'orders', COUNT(*) FROM orders
     ORDER BY tbl;
     """
-    success, output = run_psql(count_sql)
-    if success:
-        print(output)
+    for row in db.query(count_sql):
+        print(f"  {row.tbl}: {row.count}")
+    db.close()
+
+    unmapped = import_normalize.unmapped_report()
+    if unmapped:
+        print("\n" + "="*60)
+        print("UNMAPPED VALUES (kept as is)")
+        print("="*60)
+        for column, values in unmapped.items():
+            shown = ', '.join(repr(v) for v in values[:10])
+            more = f" (+{len(values) - 10} more)" if len(values) > 10 else ""
+            print(f"  {column}: {shown}{more}")
+
+    path = report.write(args.report)
+    print(f"\nRun report: {path}")
+    return 1 if rolled_back else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
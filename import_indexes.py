@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Deferred index maintenance for bulk loads (--defer-indexes).
+
+Before a table is loaded its secondary indexes (not unique, not backing a
+constraint) are dropped, so the batches only maintain the primary key and
+unique indexes that ON CONFLICT and the constraints need. When the table is
+done the indexes are rebuilt from their saved definitions, several at once
+on separate connections, each build with a larger maintenance_work_mem and
+Postgres's own parallel workers, and the table is analyzed.
+
+The definitions are saved to .import_cache/deferred_indexes.json before
+anything is dropped and removed once rebuilt, so an interrupted run never
+loses an index: the next run rebuilds whatever the journal still holds
+(restore_pending), or keeps it dropped if that table is bulk-loaded again.
+
+In an --atomic run the drop is part of the run's transaction, so the
+rebuild has to happen on that same connection, one index after another.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import import_db
+from import_schema import CACHE_DIR
+
+JOURNAL_FILE = os.path.join(CACHE_DIR, 'deferred_indexes.json')
+
+# Indexes built at once per table
+REBUILD_WORKERS = 4
+# Session settings of each rebuild connection
+REBUILD_SETTINGS = {
+    'maintenance_work_mem': '512MB',
+    'max_parallel_maintenance_workers': 2,
+}
+
+SECONDARY_INDEXES_SQL = """
+SELECT ic.relname AS name, pg_get_indexdef(i.indexrelid) AS definition
+FROM pg_index i
+JOIN pg_class ic ON ic.oid = i.indexrelid
+WHERE i.indrelid = %s::regclass
+  AND NOT i.indisunique AND NOT i.indisprimary
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint x WHERE x.conindid = i.indexrelid)
+ORDER BY ic.relname
+"""
+
+_journal_lock = threading.Lock()
+
+
+def _read_journal():
+    try:
+        with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_journal(table_name, indexes):
+    """Set (or with no indexes, clear) the saved definitions of a table"""
+    with _journal_lock:
+        journal = _read_journal()
+        if indexes:
+            journal[table_name] = indexes
+        else:
+            journal.pop(table_name, None)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = JOURNAL_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(journal, f, indent=1)
+        os.replace(tmp_path, JOURNAL_FILE)
+
+
+def pending():
+    """{table: [{'name', 'definition'}]} of indexes still dropped"""
+    with _journal_lock:
+        return _read_journal()
+
+
+class IndexDeferral:
+    """Drops a table's secondary indexes and rebuilds them"""
+
+    def __init__(self, db, table_name, parallel=True):
+        self.db = db
+        self.table_name = table_name
+        self.parallel = parallel
+        self.indexes = []
+
+    def drop(self):
+        """Save and drop the secondary indexes; returns how many are dropped
+        (including any an interrupted run left dropped)"""
+        saved = pending().get(self.table_name, [])
+        live = [
+            {'name': row.name, 'definition': row.definition}
+            for row in self.db.query(SECONDARY_INDEXES_SQL, (f"public.{self.table_name}",))
+        ]
+        known = {index['name'] for index in saved}
+        self.indexes = saved + [index for index in live if index['name'] not in known]
+        if not self.indexes:
+            return 0
+        _update_journal(self.table_name, self.indexes)
+        with self.db.connection() as conn, conn.cursor() as cur:
+            for index in live:
+                cur.execute(f"DROP INDEX IF EXISTS public.{index['name']}")
+        return len(self.indexes)
+
+    def rebuild(self, log, workers=REBUILD_WORKERS):
+        """Recreate the dropped indexes in parallel and analyze the table;
+        returns the names of indexes that could not be built (they stay in
+        the journal)"""
+        if not self.indexes:
+            return []
+        if not self.parallel:
+            return self._rebuild_serial(log)
+        workers = max(1, min(workers, len(self.indexes)))
+        failed = []
+        with import_db.Database(self.db.dsn, max_connections=workers) as pool_db:
+
+            def build(index):
+                try:
+                    with pool_db.connection() as conn, conn.cursor() as cur:
+                        for name, value in REBUILD_SETTINGS.items():
+                            cur.execute(f"SET LOCAL {name} = %s", (str(value),))
+                        cur.execute(_if_not_exists(index['definition']))
+                except import_db.Error as e:
+                    return index, str(e).strip()
+                return index, None
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for index, error in executor.map(build, self.indexes):
+                    if error is None:
+                        log(f"  Rebuilt index {index['name']}")
+                    else:
+                        log(f"  ERROR rebuilding index {index['name']}: {error[:300]}")
+                        failed.append(index)
+        _update_journal(self.table_name, failed)
+        self.indexes = failed
+        self.db.execute(f"ANALYZE public.{self.table_name}")
+        return [index['name'] for index in failed]
+
+    def _rebuild_serial(self, log):
+        """Rebuild on the deferral's own database, in its transaction (an
+        error there aborts the transaction, so it is raised)"""
+        with self.db.connection() as conn, conn.cursor() as cur:
+            for name, value in REBUILD_SETTINGS.items():
+                cur.execute(f"SET LOCAL {name} = %s", (str(value),))
+            for index in self.indexes:
+                cur.execute(_if_not_exists(index['definition']))
+                log(f"  Rebuilt index {index['name']}")
+            cur.execute(f"ANALYZE public.{self.table_name}")
+        _update_journal(self.table_name, [])
+        self.indexes = []
+        return []
+
+
+def _if_not_exists(definition):
+    """CREATE INDEX statement that tolerates an index already rebuilt"""
+    for prefix in ("CREATE INDEX ", "CREATE UNIQUE INDEX "):
+        if definition.startswith(prefix):
+            return prefix + "IF NOT EXISTS " + definition[len(prefix):]
+    return definition
+
+
+def restore_pending(db, log, skip=()):
+    """Rebuild the indexes an interrupted run left dropped, except those of
+    tables in skip; returns the names that could not be built"""
+    failed = []
+    for table_name, indexes in pending().items():
+        if table_name in skip:
+            continue
+        log(f"  Restoring {len(indexes)} indexes of {table_name} left dropped by an earlier run")
+        deferral = IndexDeferral(db, table_name)
+        deferral.indexes = indexes
+        failed += deferral.rebuild(log)
+    return failed
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Name-based column mapping for the historical import.
+
+Derives each table's skip/reorder/default plan by column name from the dump's
+own column order (COPY column list or CREATE TABLE, see dump_index.py) and the
+live schema, instead of the hand-written index maps in
+TABLE_CONFIGS that drift from the real schemas:
+
+- dump columns with no local column of the same name are skipped
+- local columns are fed in local order from the dump column of the same name
+- local columns the dump does not have are left out of the COPY, so they get
+  their column defaults
+
+Local columns come from the cached schema metadata (import_schema.py), and
+derived plans are cached in .import_cache/mapping_plans.json keyed by a
+fingerprint of both schemas, so a run against unchanged schemas neither
+queries the catalog nor re-derives anything.
+"""
+
+import hashlib
+import json
+import os
+
+import import_schema
+import import_transform
+from import_schema import CACHE_DIR
+
+PLAN_CACHE_FILE = os.path.join(CACHE_DIR, 'mapping_plans.json')
+
+# Bump when the shape of a cached mapping changes
+MAPPING_VERSION = 1
+
+
+def derive_mapping(dump_columns, local_columns, normalize=None):
+    """Map dump columns onto local columns by name.
+
+    normalize is {dump column name: field type} for value normalization.
+    Returns a JSON-serializable mapping:
+        columns    local columns to COPY, in local order
+        sources    dump index feeding each of those columns
+        normalize  {dump index: field type}
+        width      number of dump columns
+        skipped    dump columns with no local counterpart
+        defaulted  local columns left to their defaults
+    """
+    dump_pos = {name: i for i, name in enumerate(dump_columns)}
+    columns = [col for col in local_columns if col in dump_pos]
+    local_set = set(local_columns)
+    return {
+        'columns': columns,
+        'sources': [dump_pos[col] for col in columns],
+        'normalize': {
+            str(dump_pos[col]): field_type
+            for col, field_type in sorted((normalize or {}).items())
+            if col in dump_pos and col in local_set
+        },
+        'width': len(dump_columns),
+        'skipped': [col for col in dump_columns if col not in local_set],
+        'defaulted': [col for col in local_columns if col not in dump_pos],
+    }
+
+
+def schema_fingerprint(dump_columns, local_columns, normalize):
+    """Stable hash of everything a set of mappings is derived from"""
+    payload = json.dumps(
+        {
+            'version': MAPPING_VERSION,
+            'dump': dump_columns,
+            'local': local_columns,
+            'normalize': normalize,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _read_cache():
+    try:
+        with open(PLAN_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = PLAN_CACHE_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp_path, PLAN_CACHE_FILE)
+    except OSError as e:
+        print(f"  WARNING: Could not write mapping cache {PLAN_CACHE_FILE}: {e}")
+
+
+def mapping_plans(metadata, reader, tables, normalize=None):
+    """Name-based mappings for all tables: {table: mapping or None}.
+
+    metadata is the schema metadata from import_schema.load_metadata().
+    A table maps to None when the dump does not name its columns or the
+    local table does not exist; callers fall back to TABLE_CONFIGS then.
+    normalize is {table: {dump column name: field type}}.
+    """
+    normalize = normalize or {}
+    dump_columns = {t: reader.dump_columns(t) for t in tables}
+    local_columns = {t: import_schema.column_names(metadata, t) for t in tables}
+    fingerprint = schema_fingerprint(dump_columns, local_columns, normalize)
+
+    cache = _read_cache()
+    if cache.get('fingerprint') == fingerprint:
+        return cache['mappings']
+
+    mappings = {}
+    for table in tables:
+        if dump_columns.get(table) and local_columns.get(table):
+            mappings[table] = derive_mapping(
+                dump_columns[table], local_columns[table], normalize.get(table))
+        else:
+            mappings[table] = None
+
+    _write_cache({'fingerprint': fingerprint, 'mappings': mappings})
+    return mappings
+
+
+def projection_for(mapping, normalizers):
+    """ProjectionPlan for a mapping, or None if rows pass through unchanged"""
+    width = mapping['width']
+    steps = [
+        (int(idx), import_transform.table_for(normalizers[field_type], int(idx)))
+        for idx, field_type in sorted(mapping['normalize'].items(), key=lambda kv: int(kv[0]))
+        if field_type in normalizers
+    ]
+    if mapping['sources'] == list(range(width)) and not steps:
+        return None
+    return import_transform.ProjectionPlan(mapping['sources'], width, steps)
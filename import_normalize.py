@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Value normalization for the historical import.
+
+One shared vocabulary per field type (ISO 3166-1 countries, US states and
+territories, and the status/role enums of packages/shared) replaces the
+per-script COUNTRY_NORMALIZE dicts. Values are resolved by a memoized,
+case- and punctuation-insensitive resolver ("u.s.a.", "USA", "United States"
+-> "US"; "Not Public" -> "not_public").
+
+Columns are normalized through import_transform.CodeTable, a {bytes: bytes}
+dict that resolves a value the first time it sees it and stores the answer:
+each distinct value of a column is resolved exactly once, and every other
+cell is a plain dict hit (row engine) or not looked at at all (columnar
+engine, which only visits distinct values). Values that resolve to nothing
+are kept as they are and collected per column for the unmapped-values
+report.
+"""
+
+import re
+import threading
+
+from import_transform import CodeTable
+
+# ISO 3166-1: alpha-2, alpha-3, short name
+_ISO_3166 = """
+AD AND Andorra
+AE ARE United Arab Emirates
+AF AFG Afghanistan
+AG ATG Antigua and Barbuda
+AI AIA Anguilla
+AL ALB Albania
+AM ARM Armenia
+AO AGO Angola
+AQ ATA Antarctica
+AR ARG Argentina
+AS ASM American Samoa
+AT AUT Austria
+AU AUS Australia
+AW ABW Aruba
+AX ALA Aland Islands
+AZ AZE Azerbaijan
+BA BIH Bosnia and Herzegovina
+BB BRB Barbados
+BD BGD Bangladesh
+BE BEL Belgium
+BF BFA Burkina Faso
+BG BGR Bulgaria
+BH BHR Bahrain
+BI BDI Burundi
+BJ BEN Benin
+BL BLM Saint Barthelemy
+BM BMU Bermuda
+BN BRN Brunei Darussalam
+BO BOL Bolivia
+BQ BES Bonaire, Sint Eustatius and Saba
+BR BRA Brazil
+BS BHS Bahamas
+BT BTN Bhutan
+BV BVT Bouvet Island
+BW BWA Botswana
+BY BLR Belarus
+BZ BLZ Belize
+CA CAN Canada
+CC CCK Cocos (Keeling) Islands
+CD COD Congo, Democratic Republic of the
+CF CAF Central African Republic
+CG COG Congo
+CH CHE Switzerland
+CI CIV Cote d'Ivoire
+CK COK Cook Islands
+CL CHL Chile
+CM CMR Cameroon
+CN CHN China
+CO COL Colombia
+CR CRI Costa Rica
+CU CUB Cuba
+CV CPV Cabo Verde
+CW CUW Curacao
+CX CXR Christmas Island
+CY CYP Cyprus
+CZ CZE Czechia
+DE DEU Germany
+DJ DJI Djibouti
+DK DNK Denmark
+DM DMA Dominica
+DO DOM Dominican Republic
+DZ DZA Algeria
+EC ECU Ecuador
+EE EST Estonia
+EG EGY Egypt
+EH ESH Western Sahara
+ER ERI Eritrea
+ES ESP Spain
+ET ETH Ethiopia
+FI FIN Finland
+FJ FJI Fiji
+FK FLK Falkland Islands
+FM FSM Micronesia
+FO FRO Faroe Islands
+FR FRA France
+GA GAB Gabon
+GB GBR United Kingdom
+GD GRD Grenada
+GE GEO Georgia
+GF GUF French Guiana
+GG GGY Guernsey
+GH GHA Ghana
+GI GIB Gibraltar
+GL GRL Greenland
+GM GMB Gambia
+GN GIN Guinea
+GP GLP Guadeloupe
+GQ GNQ Equatorial Guinea
+GR GRC Greece
+GS SGS South Georgia and the South Sandwich Islands
+GT GTM Guatemala
+GU GUM Guam
+GW GNB Guinea-Bissau
+GY GUY Guyana
+HK HKG Hong Kong
+HM HMD Heard Island and McDonald Islands
+HN HND Honduras
+HR HRV Croatia
+HT HTI Haiti
+HU HUN Hungary
+ID IDN Indonesia
+IE IRL Ireland
+IL ISR Israel
+IM IMN Isle of Man
+IN IND India
+IO IOT British Indian Ocean Territory
+IQ IRQ Iraq
+IR IRN Iran
+IS ISL Iceland
+IT ITA Italy
+JE JEY Jersey
+JM JAM Jamaica
+JO JOR Jordan
+JP JPN Japan
+KE KEN Kenya
+KG KGZ Kyrgyzstan
+KH KHM Cambodia
+KI KIR Kiribati
+KM COM Comoros
+KN KNA Saint Kitts and Nevis
+KP PRK North Korea
+KR KOR South Korea
+KW KWT Kuwait
+KY CYM Cayman Islands
+KZ KAZ Kazakhstan
+LA LAO Laos
+LB LBN Lebanon
+LC LCA Saint Lucia
+LI LIE Liechtenstein
+LK LKA Sri Lanka
+LR LBR Liberia
+LS LSO Lesotho
+LT LTU Lithuania
+LU LUX Luxembourg
+LV LVA Latvia
+LY LBY Libya
+MA MAR Morocco
+MC MCO Monaco
+MD MDA Moldova
+ME MNE Montenegro
+MF MAF Saint Martin (French part)
+MG MDG Madagascar
+MH MHL Marshall Islands
+MK MKD North Macedonia
+ML MLI Mali
+MM MMR Myanmar
+MN MNG Mongolia
+MO MAC Macao
+MP MNP Northern Mariana Islands
+MQ MTQ Martinique
+MR MRT Mauritania
+MS MSR Montserrat
+MT MLT Malta
+MU MUS Mauritius
+MV MDV Maldives
+MW MWI Malawi
+MX MEX Mexico
+MY MYS Malaysia
+MZ MOZ Mozambique
+NA NAM Namibia
+NC NCL New Caledonia
+NE NER Niger
+NF NFK Norfolk Island
+NG NGA Nigeria
+NI NIC Nicaragua
+NL NLD Netherlands
+NO NOR Norway
+NP NPL Nepal
+NR NRU Nauru
+NU NIU Niue
+NZ NZL New Zealand
+OM OMN Oman
+PA PAN Panama
+PE PER Peru
+PF PYF French Polynesia
+PG PNG Papua New Guinea
+PH PHL Philippines
+PK PAK Pakistan
+PL POL Poland
+PM SPM Saint Pierre and Miquelon
+PN PCN Pitcairn
+PR PRI Puerto Rico
+PS PSE Palestine
+PT PRT Portugal
+PW PLW Palau
+PY PRY Paraguay
+QA QAT Qatar
+RE REU Reunion
+RO ROU Romania
+RS SRB Serbia
+RU RUS Russia
+RW RWA Rwanda
+SA SAU Saudi Arabia
+SB SLB Solomon Islands
+SC SYC Seychelles
+SD SDN Sudan
+SE SWE Sweden
+SG SGP Singapore
+SH SHN Saint Helena, Ascension and Tristan da Cunha
+SI SVN Slovenia
+SJ SJM Svalbard and Jan Mayen
+SK SVK Slovakia
+SL SLE Sierra Leone
+SM SMR San Marino
+SN SEN Senegal
+SO SOM Somalia
+SR SUR Suriname
+SS SSD South Sudan
+ST STP Sao Tome and Principe
+SV SLV El Salvador
+SX SXM Sint Maarten (Dutch part)
+SY SYR Syria
+SZ SWZ Eswatini
+TC TCA Turks and Caicos Islands
+TD TCD Chad
+TF ATF French Southern Territories
+TG TGO Togo
+TH THA Thailand
+TJ TJK Tajikistan
+TK TKL Tokelau
+TL TLS Timor-Leste
+TM TKM Turkmenistan
+TN TUN Tunisia
+TO TON Tonga
+TR TUR Turkey
+TT TTO Trinidad and Tobago
+TV TUV Tuvalu
+TW TWN Taiwan
+TZ TZA Tanzania
+UA UKR Ukraine
+UG UGA Uganda
+UM UMI United States Minor Outlying Islands
+US USA United States
+UY URY Uruguay
+UZ UZB Uzbekistan
+VA VAT Holy See
+VC VCT Saint Vincent and the Grenadines
+VE VEN Venezuela
+VG VGB Virgin Islands (British)
+VI VIR Virgin Islands (U.S.)
+VN VNM Viet Nam
+VU VUT Vanuatu
+WF WLF Wallis and Futuna
+WS WSM Samoa
+YE YEM Yemen
+YT MYT Mayotte
+ZA ZAF South Africa
+ZM ZMB Zambia
+ZW ZWE Zimbabwe
+"""
+
+# Other spellings seen in the wild -> alpha-2
+COUNTRY_ALIASES = {
+    'United States of America': 'US',
+    'America': 'US',
+    'U.S.': 'US',
+    'U.S.A.': 'US',
+    'UK': 'GB',
+    'Great Britain': 'GB',
+    'England': 'GB',
+    'Scotland': 'GB',
+    'Wales': 'GB',
+    'Northern Ireland': 'GB',
+    'Korea, Republic of': 'KR',
+    'Republic of Korea': 'KR',
+    'Russian Federation': 'RU',
+    'Vietnam': 'VN',
+    'Czech Republic': 'CZ',
+    'Holland': 'NL',
+    'The Netherlands': 'NL',
+    'Turkiye': 'TR',
+    'Swaziland': 'SZ',
+    'Macedonia': 'MK',
+    'Ivory Coast': 'CI',
+    'Cape Verde': 'CV',
+    'Burma': 'MM',
+    'Vatican City': 'VA',
+    'UAE': 'AE',
+}
+
+# USPS codes of the states, DC and territories
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas',
+    'CA': 'California', 'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware',
+    'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii', 'ID': 'Idaho',
+    'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
+    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi',
+    'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma',
+    'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina',
+    'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah',
+    'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia',
+    'WI': 'Wisconsin', 'WY': 'Wyoming', 'DC': 'District of Columbia',
+    'AS': 'American Samoa', 'GU': 'Guam', 'MP': 'Northern Mariana Islands',
+    'PR': 'Puerto Rico', 'VI': 'U.S. Virgin Islands',
+}
+
+US_STATE_ALIASES = {
+    'Washington DC': 'DC',
+    'Washington D.C.': 'DC',
+    'Virgin Islands': 'VI',
+}
+
+# Enum values from packages/shared/src/schemas (enums.schema.ts,
+# billing-enums.schema.ts)
+ENUMS = {
+    'user_role': ['user', 'competitor', 'event_director', 'judge', 'retailer',
+                  'manufacturer', 'admin'],
+    'membership_status': ['none', 'active', 'expired'],
+    'event_status': ['pending', 'upcoming', 'ongoing', 'completed', 'cancelled',
+                     'not_public'],
+    'payment_status': ['pending', 'paid', 'refunded', 'failed', 'cancelled', 'inactive'],
+    'order_status': ['pending', 'processing', 'completed', 'cancelled', 'refunded',
+                     'failed'],
+}
+
+ENUM_ALIASES = {
+    'canceled': 'cancelled',
+    'in_progress': 'ongoing',
+    'private': 'not_public',
+}
+
+
+def lookup_key(value):
+    """Case- and punctuation-insensitive form of a value"""
+    return re.sub(r'[\W_]+', '', value.casefold())
+
+
+class Resolver:
+    """Memoized value -> canonical value lookup for one vocabulary"""
+
+    def __init__(self, entries):
+        # entries: (spelling, canonical) pairs; earlier spellings win
+        self._by_key = {}
+        for spelling, canonical in entries:
+            self._by_key.setdefault(lookup_key(spelling), canonical)
+        self._memo = {}
+
+    def resolve(self, value):
+        """Canonical value, or None if the value is not in the vocabulary"""
+        try:
+            return self._memo[value]
+        except KeyError:
+            canonical = self._by_key.get(lookup_key(value))
+            self._memo[value] = canonical
+            return canonical
+
+
+def _country_entries():
+    rows = [line.split(' ', 2) for line in _ISO_3166.strip().splitlines()]
+    for alpha2, alpha3, name in rows:
+        yield alpha2, alpha2
+        yield alpha3, alpha2
+        yield name, alpha2
+    yield from ((alias, code) for alias, code in COUNTRY_ALIASES.items())
+
+
+def _state_entries():
+    for code, name in US_STATES.items():
+        yield code, code
+        yield name, code
+    yield from US_STATE_ALIASES.items()
+
+
+def _enum_entries(values):
+    for value in values:
+        yield value, value
+    for alias, value in ENUM_ALIASES.items():
+        if value in values:
+            yield alias, value
+
+
+RESOLVERS = {
+    'country': Resolver(_country_entries()),
+    'us_state': Resolver(_state_entries()),
+    **{name: Resolver(_enum_entries(values)) for name, values in ENUMS.items()},
+}
+
+
+_created = []
+_created_lock = threading.Lock()
+
+
+def code_table(field_type, name=None):
+    """Fresh self-filling code table for a field type. Use one per column
+    (name it "table.column"), so unmapped values are reported per column."""
+    table = CodeTable(resolve=RESOLVERS[field_type].resolve, name=name)
+    with _created_lock:
+        _created.append(table)
+    return table
+
+
+def column_normalizers(table_name, dump_columns=None):
+    """{field type: factory(dump column index) -> code table} for one table,
+    for compile_plan()/projection_for()"""
+    names = dump_columns or []
+
+    def factory(field_type):
+        def make(idx):
+            column = names[idx] if idx < len(names) else str(idx)
+            return code_table(field_type, f"{table_name}.{column}")
+        return make
+
+    return {field_type: factory(field_type) for field_type in RESOLVERS}
+
+
+def unmapped_report(tables=None):
+    """{column name: sorted unmapped values} for the given code tables, by
+    default every table made by code_table()"""
+    if tables is None:
+        with _created_lock:
+            tables = list(_created)
+    report = {}
+    for table in tables:
+        if table.unmapped:
+            values = report.setdefault(table.name or '?', set())
+            values.update(v.decode('utf-8', 'replace') for v in table.unmapped)
+    return {name: sorted(values) for name, values in sorted(report.items())}
@@ -5,9 +5,10 @@ Handles differences between dump schema and local schema.
 """
 
 import subprocess
-import re
 import sys
 
+import dump_index
+
 DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
 DOCKER_CMD = ["docker", "exec", "-i", "supabase_db_NewMECAV2", "psql", "-U", "postgres", "-d", "postgres"]
 
@@ -134,15 +135,10 @@ def run_psql(sql, description=""):
     return True, output
 
 def extract_copy_data(table_name):
-    """Extract COPY data for a table from the dump file"""
-    with open(DUMP_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Find the COPY statement and data
-    pattern = rf'COPY {table_name} FROM stdin;\n(.*?)\n\\.'
-    match = re.search(pattern, content, re.DOTALL)
-    if match:
-        return match.group(1)
+    """Extract COPY data for a table via the dump index (no full re-read)"""
+    data = dump_index.extract_copy_data(DUMP_FILE, table_name)
+    if data is not None:
+        return data
 
     print(f"  No data found for table {table_name}")
     return None
@@ -2,13 +2,18 @@
 """
 Fixed profiles import with proper column mapping.
 Handles both column skip (membership_expires_at) and column reordering.
+meca_id conflicts are caught client-side before the COPY (import_unique.py).
 """
 
-import subprocess
-import re
+import dump_index
+import import_db
+import import_normalize
+import import_rejects
+import import_schema
+import import_transform
+import import_unique
 
 DUMP_FILE = "E:/MECA Oct 2025/NewMECAV2/apps/backend/src/migrations/dump_production.sql"
-DOCKER_CMD = ["docker", "exec", "-i", "supabase_db_NewMECAV2", "psql", "-U", "postgres", "-d", "postgres"]
 
 # Dump schema column order (0-indexed, from schema_baseline):
 # 0: id, 1: email, 2: full_name, 3: phone, 4: role, 5: membership_status
@@ -72,50 +77,17 @@ COLUMN_MAP = {
     **{i: i for i in range(41, 50)},
 }
 
-# ISO country normalization
-COUNTRY_NORMALIZE = {
-    'USA': 'US',
-    'United States': 'US',
-    'U.S.A.': 'US',
-    'U.S.': 'US',
-}
-
 # Country column indices (in dump, before skip)
 COUNTRY_COLS = [19, 24, 31]  # billing_country, shipping_country, country
 
-
-def run_psql(sql, description=""):
-    if description:
-        print(f"  {description}...")
-    proc = subprocess.run(DOCKER_CMD, input=sql.encode('utf-8'), capture_output=True)
-    if proc.returncode != 0:
-        print(f"  ERROR: {proc.stderr.decode('utf-8')[:500]}")
-        return False, proc.stderr.decode('utf-8')
-    return True, proc.stdout.decode('utf-8')
-
-
-def normalize_country(value):
-    return COUNTRY_NORMALIZE.get(value, value)
-
-
-def transform_row(row):
-    cols = row.split('\t')
-
-    # Normalize country columns (before skip)
-    for idx in COUNTRY_COLS:
-        if idx < len(cols):
-            cols[idx] = normalize_country(cols[idx])
-
-    # Skip column 26
-    filtered = [col for i, col in enumerate(cols) if i != SKIP_COL]
-
-    # Apply reordering
-    output = ['\\N'] * 50
-    for src_idx, dst_idx in COLUMN_MAP.items():
-        if src_idx < len(filtered):
-            output[dst_idx] = filtered[src_idx]
-
-    return '\t'.join(output)
+# Same shape as TABLE_CONFIGS in import_historical_final.py, compiled once
+# into a projection plan (see import_transform.py)
+PROFILES_CONFIG = {
+    'skip_indices': [SKIP_COL],
+    'column_reorder': COLUMN_MAP,
+    'num_local_cols': 50,
+    'iso_normalize': {idx: 'country' for idx in COUNTRY_COLS},
+}
 
 
 def main():
@@ -123,68 +95,64 @@ def main():
     print("PROFILES IMPORT (FIXED)")
     print("="*60)
 
-    # Read dump data
-    with open(DUMP_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    pattern = r'COPY profiles FROM stdin;\n(.*?)\n\\.'
-    match = re.search(pattern, content, re.DOTALL)
-    if not match:
-        print("ERROR: Could not find profiles data in dump")
-        return
-
-    lines = match.group(1).strip().split('\n')
-    print(f"  Found {len(lines)} profiles in dump")
-
-    # Transform all rows
-    print("  Transforming rows (skip col 26, reorder 35-40, ISO normalize)...")
-    transformed = [transform_row(line) for line in lines]
-    transformed_data = '\n'.join(transformed)
-
-    # Get local columns
-    success, output = run_psql("""
-        SELECT string_agg(column_name, ', ' ORDER BY ordinal_position)
-        FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'profiles';
-    """)
-    columns = output.strip().split('\n')[-2].strip()
-    print(f"  Local columns: {len(columns.split(', '))}")
-
-    # Build import SQL - handle both id AND meca_id conflicts
-    sql = f"""
-SET session_replication_role = replica;
-
-CREATE TEMP TABLE tmp_profiles (LIKE public.profiles INCLUDING ALL);
-
-COPY tmp_profiles ({columns}) FROM stdin;
-{transformed_data}
-\\.
-
--- Delete rows from temp that have conflicting meca_id with existing profiles
-DELETE FROM tmp_profiles t
-WHERE EXISTS (
-    SELECT 1 FROM public.profiles p WHERE p.meca_id = t.meca_id
-);
-
--- Now insert, handling only id conflicts
-INSERT INTO public.profiles ({columns})
-SELECT {columns} FROM tmp_profiles
-ON CONFLICT (id) DO NOTHING;
-
-DROP TABLE tmp_profiles;
-
-SET session_replication_role = DEFAULT;
-
-SELECT COUNT(*) as total FROM public.profiles;
-"""
-
-    success, output = run_psql(sql, "Executing import")
-
-    if success:
-        print(f"\nResult:\n{output}")
-    else:
-        # Try to identify the error row
-        print("\nTrying to identify problematic row...")
+    db = import_db.Database(max_connections=1)
+    try:
+        metadata = import_schema.load_metadata(db, ['profiles'])
+        columns = import_schema.column_names(metadata, 'profiles')
+        print(f"  Local columns: {len(columns)}")
+
+        # Read dump data (seeks straight to the block via the dump index)
+        with dump_index.DumpReader(DUMP_FILE) as reader:
+            row_count = reader.row_count('profiles')
+            if not row_count:
+                print("ERROR: Could not find profiles data in dump")
+                return
+            print(f"  Found {row_count} profiles in dump")
+
+            print("  Transforming rows (skip col 26, reorder 35-40, ISO normalize)...")
+            plan = import_transform.compile_plan(
+                PROFILES_CONFIG,
+                reader.column_count('profiles'),
+                import_normalize.column_normalizers('profiles', reader.dump_columns('profiles')),
+            )
+
+            # meca_id clashes (with existing profiles or within the dump) are
+            # classified client-side instead of a DELETE ... WHERE EXISTS over
+            # the staging table
+            unique = import_unique.UniqueValidator(db, metadata, 'profiles', columns, plan)
+            # Own file, so the main importer's profiles.jsonl is left alone
+            rejects = import_rejects.RejectLog('profiles', name='profiles_fixed')
+            try:
+                rows = unique.filter(list(reader.iter_rows('profiles')), rejects)
+            finally:
+                rejects.close()
+            for name, count in sorted(unique.conflicts.items()):
+                print(f"  Unique conflicts ({name}): {count}")
+            if rejects.count:
+                print(f"  Held back {rejects.count} rows (see {rejects.path})")
+
+            print("  Executing import...")
+            try:
+                with db.connection() as conn, conn.cursor() as cur:
+                    cur.execute("SET LOCAL session_replication_role = replica")
+                    cur.execute("""
+                        CREATE TEMP TABLE tmp_profiles (LIKE public.profiles INCLUDING ALL)
+                        ON COMMIT DROP
+                    """)
+                    import_db.copy_rows(cur, 'tmp_profiles', columns, plan.iter_apply(rows))
+                    col_sql = ', '.join(columns)
+                    cur.execute(f"""
+                        INSERT INTO public.profiles ({col_sql})
+                        SELECT {col_sql} FROM tmp_profiles
+                        ON CONFLICT (id) DO NOTHING
+                    """)
+                    print(f"  Inserted: {cur.rowcount}")
+                    cur.execute("SELECT COUNT(*) FROM public.profiles")
+                    print(f"\nResult: {cur.fetchone()[0]} profiles")
+            except import_db.Error as e:
+                print(f"  ERROR: {str(e).strip()[:500]}")
+    finally:
+        db.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Bad-row isolation for the historical import.
+
+When a batch fails with a data error (bad value, NOT NULL, CHECK, unique or FK
+violation) it is not thrown away: load_isolating() retries it inside
+savepoints, halving the failing part each time, until the offending rows are
+isolated in O(log n) attempts per bad row. When the error names a COPY line
+(bad input values) that row is taken out directly without bisecting. Isolated
+rows go to a JSON-lines reject file with the Postgres error and the column
+that failed; everything else in the batch is loaded.
+
+Replaces the by-hand hunts of test_single_profile.py / debug_profiles*.py.
+"""
+
+import json
+import os
+import re
+import threading
+
+import import_db
+from import_schema import CACHE_DIR
+
+REJECTS_DIR = os.path.join(CACHE_DIR, 'rejects')
+
+# SQLSTATE classes caused by row contents; anything else fails the batch
+DATA_ERROR_CLASSES = ('22', '23')
+
+_COPY_CONTEXT_RE = re.compile(r'COPY \S+, line (\d+)(?:, column (\w+))?')
+_KEY_DETAIL_RE = re.compile(r'^Key \(([^)]*)\)')
+
+
+def is_data_error(error):
+    return (getattr(error, 'pgcode', None) or '')[:2] in DATA_ERROR_CLASSES
+
+
+def copy_error_line(error):
+    """1-based line of the COPY input that failed, or None"""
+    match = _COPY_CONTEXT_RE.search(_context(error))
+    return int(match.group(1)) if match else None
+
+
+def error_column(error):
+    """Best guess at the column a row failed on, or None"""
+    diag = getattr(error, 'diag', None)
+    if diag is not None and diag.column_name:
+        return diag.column_name
+    match = _COPY_CONTEXT_RE.search(_context(error))
+    if match and match.group(2):
+        return match.group(2)
+    # Unique and FK violations name the key columns in the detail
+    match = _KEY_DETAIL_RE.match((diag.message_detail if diag is not None else None) or '')
+    if match:
+        return match.group(1)
+    return None
+
+
+def _context(error):
+    diag = getattr(error, 'diag', None)
+    return (diag.context if diag is not None else None) or ''
+
+
+class RejectLog:
+    """Per-table JSON-lines file of rows that could not be loaded"""
+
+    def __init__(self, table_name, directory=None, append=False, name=None):
+        # name: file name when not the table's own (another loader's log)
+        self.table_name = table_name
+        self.append = append
+        self.path = os.path.join(directory or REJECTS_DIR, f"{name or table_name}.jsonl")
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def add(self, row, error, batch_offset=None, row_in_batch=None, column=None):
+        """Record one dump row (bytes) and the error that rejected it;
+        column when the caller knows better than the error"""
+        diag = getattr(error, 'diag', None)
+        self._write({
+            'table': self.table_name,
+            'batch_offset': batch_offset,
+            'row_in_batch': row_in_batch,
+            'sqlstate': getattr(error, 'pgcode', None),
+            'error': (diag.message_primary if diag is not None else None) or str(error).strip(),
+            'detail': diag.message_detail if diag is not None else None,
+            'column': column or error_column(error),
+            'constraint': diag.constraint_name if diag is not None else None,
+            'row': row.decode('utf-8', 'replace'),
+        })
+
+    def add_conflict(self, row, kind, columns, value, batch_offset=None, row_in_batch=None):
+        """Record one dump row held back by the unique pre-validation"""
+        self._write({
+            'table': self.table_name,
+            'batch_offset': batch_offset,
+            'row_in_batch': row_in_batch,
+            'sqlstate': '23505',
+            'error': f"unique conflict ({kind}) on {', '.join(columns)}",
+            'detail': f"Key ({', '.join(columns)})=({', '.join(v.decode('utf-8', 'replace') for v in value)})",
+            'column': ', '.join(columns),
+            'constraint': None,
+            'row': row.decode('utf-8', 'replace'),
+        })
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_isolating(cur, rows, load, rejects, batch_offset=None, locate=None):
+    """Load rows with load(cur, rows) -> inserted, isolating bad rows.
+
+    Must run inside a transaction. Every attempt is wrapped in a savepoint;
+    a part that fails with a data error is split (at the COPY line the error
+    names, else in half) and retried, and single rows that still fail are
+    written to `rejects`, with the column locate(cur, rows) finds when the
+    error names none. Other errors propagate. Returns (rows inserted,
+    positions in rows of the rejected rows).
+    """
+    inserted = 0
+    rejected = []
+    pending = [(0, rows)]
+    while pending:
+        first, part = pending.pop()
+        cur.execute("SAVEPOINT import_part")
+        try:
+            inserted += load(cur, part)
+        except import_db.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT import_part")
+            if not is_data_error(e):
+                raise
+            if len(part) == 1:
+                column = None
+                if locate is not None and error_column(e) is None:
+                    column = locate(cur, part)
+                rejects.add(part[0], e, batch_offset, first, column)
+                rejected.append(first)
+                continue
+            line = copy_error_line(e)
+            if line is not None and 1 <= line <= len(part):
+                bad = line - 1
+                rejects.add(part[bad], e, batch_offset, first + bad)
+                rejected.append(first + bad)
+                pending.append((first + bad + 1, part[bad + 1:]))
+                pending.append((first, part[:bad]))
+            else:
+                mid = len(part) // 2
+                pending.append((first + mid, part[mid:]))
+                pending.append((first, part[:mid]))
+            pending = [(f, p) for f, p in pending if p]
+        else:
+            cur.execute("RELEASE SAVEPOINT import_part")
+    return inserted, rejected
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Server-side remapping for the historical import (--remap server).
+
+Instead of splitting and rewriting every row in Python, a batch of dump rows
+is COPYed verbatim into a staging table that has the dump's own layout (one
+text column per dump column), and a single INSERT ... SELECT does the rest
+on the server: dump columns with no local counterpart are simply not
+selected, the others are selected in local order and cast to the local
+column types, and normalized columns go through a CASE built from the code
+tables (import_normalize.py).
+
+The client never looks inside a row: unless a delta or unique filter needs
+the rows, batches are byte ranges of the dump cut at row boundaries
+(DumpReader.iter_raw_chunks) and go to COPY unsplit. For normalized columns
+it asks the server for the batch's distinct values (one query) and resolves
+only those, so the unmapped-value report still works.
+
+The staging table is a per-session temp table, which Postgres never
+WAL-logs (what UNLOGGED buys for ordinary tables).
+"""
+
+import dump_index
+import import_binary
+import import_db
+import import_schema
+import import_transform
+
+STAGING_TABLE = 'tmp_raw'
+PROBE_TABLE = 'tmp_remap_probe'
+
+NULL = b'\\N'
+
+# Staged text is assigned to these as it is; a cast to them without the
+# length would be character(1), with it over-long strings get truncated
+UNCAST_TYPES = {'text', 'character varying', 'character'}
+
+
+class ServerRemap:
+    """Dump-layout staging table and the INSERT ... SELECT that maps it"""
+
+    def __init__(self, metadata, table_name, mapping, normalizers):
+        self.table_name = table_name
+        self.columns = mapping['columns']
+        # Dump index per local column, like ProjectionPlan.sources
+        self.sources = tuple(mapping['sources'])
+        self.width = mapping['width']
+        types = import_schema.column_types(metadata, table_name)
+        self.types = [types.get(col, 'text') for col in self.columns]
+        self.code_tables = {
+            int(idx): import_transform.table_for(normalizers[field_type], int(idx))
+            for idx, field_type in mapping['normalize'].items()
+            if field_type in normalizers
+        }
+
+    def create_staging(self, cur):
+        cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        columns = ', '.join(f"c{i} text" for i in range(self.width))
+        cur.execute(f"CREATE TEMP TABLE {STAGING_TABLE} ({columns}) ON COMMIT DELETE ROWS")
+        # The target's column types without its constraints, for failing_column()
+        cur.execute(f"DROP TABLE IF EXISTS {PROBE_TABLE}")
+        cur.execute(f"""
+            CREATE TEMP TABLE {PROBE_TABLE} ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(self.columns)} FROM public.{self.table_name} WITH NO DATA
+        """)
+
+    def drop_staging(self, cur):
+        cur.execute(f"DROP TABLE {STAGING_TABLE}")
+        cur.execute(f"DROP TABLE {PROBE_TABLE}")
+
+    def copy(self, cur, rows):
+        """COPY dump rows (bytes, or a dump_index.CopyChunk whose bytes are
+        sent unsplit) into the staging table as they are"""
+        if isinstance(rows, dump_index.CopyChunk):
+            data = rows.data
+        else:
+            data = b'\n'.join(rows) + b'\n'
+        import_db.copy_block(cur, STAGING_TABLE, None, data)
+        return len(rows)
+
+    def insert(self, cur, merge):
+        """Map the staged rows into the target table with an
+        import_upsert.Merge; returns (inserted, updated)"""
+        params = []
+        select = []
+        for expr, expr_params in self._select(cur):
+            select.append(expr)
+            params += expr_params
+        key_select = None
+        if merge.mode is not None:
+            key_select = [f"c{self.sources[self.columns.index(col)]}" for col in merge.key]
+        counts = merge.run(cur, select, STAGING_TABLE, key_select, params)
+        cur.execute(f"TRUNCATE {STAGING_TABLE}")
+        return counts
+
+    def failing_column(self, cur, rows):
+        """Local column whose value in rows cannot be stored, or None.
+
+        The INSERT ... SELECT does not say which column a bad value was in,
+        so the rows are staged again and each column is inserted on its own
+        into the probe table, inside a savepoint that is always rolled back.
+        """
+        cur.execute("SAVEPOINT remap_probe")
+        try:
+            self.copy(cur, rows)
+            for col, (expr, params) in zip(self.columns, self._select(cur)):
+                cur.execute("SAVEPOINT remap_probe_column")
+                try:
+                    cur.execute(f"INSERT INTO {PROBE_TABLE} ({col}) SELECT {expr} FROM {STAGING_TABLE}",
+                                params)
+                except import_db.Error:
+                    return col
+                finally:
+                    cur.execute("ROLLBACK TO SAVEPOINT remap_probe_column")
+            return None
+        finally:
+            cur.execute("ROLLBACK TO SAVEPOINT remap_probe")
+
+    def _select(self, cur):
+        """[(select expression, params)] per local column for the staged rows"""
+        rewrites = self._rewrites(cur)
+        select = []
+        for src, col_type in zip(self.sources, self.types):
+            expr = f"c{src}"
+            params = []
+            changes = rewrites.get(src)
+            if changes:
+                whens = []
+                for value, canonical in changes:
+                    whens.append("WHEN %s THEN %s")
+                    params += [value, canonical]
+                expr = f"CASE {expr} {' '.join(whens)} ELSE {expr} END"
+            # Casts drop the modifier, the column's own is then enforced by
+            # assignment like COPY does (an explicit cast would truncate)
+            col_type = import_binary.base_type(col_type)
+            if col_type not in UNCAST_TYPES:
+                expr = f"({expr})::{col_type}"
+            select.append((expr, params))
+        return select
+
+    def _rewrites(self, cur):
+        """{dump index: [(value, canonical or None)]} for the staged values
+        the code tables change"""
+        indices = [idx for idx in self.code_tables if idx in self.sources]
+        if not indices:
+            return {}
+        cur.execute(" UNION ".join(
+            f"SELECT {n}, c{idx} FROM {STAGING_TABLE} WHERE c{idx} IS NOT NULL"
+            for n, idx in enumerate(indices)))
+        rewrites = {}
+        for n, value in cur.fetchall():
+            idx = indices[n]
+            raw = import_transform.copy_escape(value)
+            canonical = self.code_tables[idx][raw]
+            if canonical != raw:
+                rewrites.setdefault(idx, []).append(
+                    (value, None if canonical == NULL else _copy_unescape(canonical)))
+        return rewrites
+
+
+def _copy_unescape(value):
+    text = value.decode('utf-8')
+    if '\\' not in text:
+        return text
+    out = []
+    chars = iter(text)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            char = {'t': '\t', 'n': '\n', 'r': '\r'}.get(escaped, escaped)
+        out.append(char)
+    return ''.join(out)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Run report and progress line for the historical import.
+
+Every table gets a TableStats that the importer feeds while it streams:
+
+- bytes_read          dump bytes of the batches read
+- rows_parsed         dump rows read
+- rows_skipped_existing  rows dropped by --delta (primary key already there)
+- rows_unique_conflicts  rows held back by the unique pre-check
+- rows_transformed    rows passed through the projection plan (retries of a
+                      bisected batch count again)
+- rows_rejected       rows the server refused (isolated by bisection)
+- rows_inserted       rows the merge inserted
+- rows_updated        existing rows --upsert changed
+- rows_conflicting    rows staged but skipped by ON CONFLICT (with --upsert:
+                      existing rows that were unchanged)
+
+and wall time per phase:
+
+- read       scanning the dump for the next batch
+- filter     delta and unique pre-check
+- transform  the projection plan (runs while COPY pulls rows) and binary
+             encoding
+- network    COPY minus the transform time it streams: sending plus the
+             server parsing the COPY data
+- server     merge, truncate, savepoints and commit
+- indexes    rebuilding the indexes --defer-indexes dropped, and ANALYZE
+
+At the end the report (options, peak RSS and every table) is written as JSON
+to .import_cache/reports/ or --report. Progress() optionally draws a live
+line on stderr with the share of dump bytes done and an ETA.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+from import_schema import CACHE_DIR
+
+REPORTS_DIR = os.path.join(CACHE_DIR, 'reports')
+
+COUNTERS = (
+    'bytes_read', 'rows_parsed', 'rows_skipped_existing', 'rows_unique_conflicts',
+    'rows_transformed', 'rows_rejected', 'rows_inserted', 'rows_updated', 'rows_conflicting',
+)
+PHASES = ('read', 'filter', 'transform', 'network', 'server', 'indexes')
+
+# Seconds between redraws of the progress line
+PROGRESS_INTERVAL = 0.5
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+class TableStats:
+    """Counters and phase timings of one table (used by one thread)"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.status = None
+        self.dump_rows = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def add(self, counter, n=1):
+        self.counters[counter] += n
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[phase] += time.perf_counter() - start
+
+    def timed_iter(self, phase, iterable):
+        """Iterate, charging the time spent producing each item to phase"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds[phase] += time.perf_counter() - start
+                return
+            self.seconds[phase] += time.perf_counter() - start
+            yield item
+
+    def summary(self):
+        """One log line with the phase times"""
+        return "Time: " + ", ".join(f"{phase} {self.seconds[phase]:.2f}s" for phase in PHASES)
+
+    def as_dict(self):
+        entry = {'status': self.status, 'dump_rows': self.dump_rows}
+        entry.update(self.counters)
+        entry['seconds'] = {phase: round(s, 4) for phase, s in self.seconds.items()}
+        return entry
+
+
+class RunReport:
+    """Machine-readable report of one import run"""
+
+    def __init__(self, dump_path, options=None):
+        self.dump_path = dump_path
+        self.options = {
+            key: sorted(value) if isinstance(value, set) else value
+            for key, value in (vars(options) if options is not None else {}).items()
+        }
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, table_name):
+        with self._lock:
+            if table_name not in self.tables:
+                self.tables[table_name] = TableStats(table_name)
+            return self.tables[table_name]
+
+    def as_dict(self):
+        totals = dict.fromkeys(COUNTERS, 0)
+        seconds = dict.fromkeys(PHASES, 0.0)
+        for stats in self.tables.values():
+            for counter in COUNTERS:
+                totals[counter] += stats.counters[counter]
+            for phase in PHASES:
+                seconds[phase] += stats.seconds[phase]
+        totals['seconds'] = {phase: round(s, 4) for phase, s in seconds.items()}
+        return {
+            'dump': os.path.abspath(self.dump_path),
+            'started_at': self.started.isoformat(),
+            'elapsed_seconds': round(time.perf_counter() - self._start, 3),
+            'options': self.options,
+            'peak_rss_mb': peak_rss_mb(),
+            'tables': {name: stats.as_dict() for name, stats in self.tables.items()},
+            'totals': totals,
+        }
+
+    def write(self, path=None):
+        """Write the report as JSON; returns the path"""
+        if path is None:
+            stamp = self.started.strftime('%Y%m%d-%H%M%S')
+            path = os.path.join(REPORTS_DIR, f"import-{stamp}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        return path
+
+
+class Progress:
+    """Live one-line progress on stderr, by dump bytes done across tables"""
+
+    def __init__(self, total_bytes, stream=None):
+        self.total = total_bytes
+        self.done = 0
+        self.stream = stream or sys.stderr
+        self._start = time.perf_counter()
+        self._drawn = 0.0
+        self._lock = threading.Lock()
+
+    def extend(self, nbytes):
+        """More bytes to read than planned (failed batches retried)"""
+        with self._lock:
+            self.total += nbytes
+
+    def advance(self, nbytes, label=''):
+        with self._lock:
+            self.done += nbytes
+            now = time.perf_counter()
+            if now - self._drawn >= PROGRESS_INTERVAL:
+                self._drawn = now
+                self._draw(now, label)
+
+    def _draw(self, now, label):
+        elapsed = now - self._start
+        share = min(1.0, self.done / self.total) if self.total else 1.0
+        rate = self.done / elapsed if elapsed > 0 else 0
+        if rate > 0 and share < 1.0:
+            eta = _clock((self.total - self.done) / rate)
+        else:
+            eta = '--:--'
+        self.stream.write(
+            f"\r  {share:6.1%}  {self.done / 1e6:,.1f}/{self.total / 1e6:,.1f} MB"
+            f"  {rate / 1e6:,.1f} MB/s  ETA {eta}  {label:<24}")
+        self.stream.flush()
+
+    def finish(self):
+        with self._lock:
+            self._draw(time.perf_counter(), 'done')
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+def _clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Schema metadata cache for the historical import.
+
+Fetches the columns (with types), primary key, unique constraints and foreign
+keys of every target table in one batched catalog query and caches the result
+in .import_cache/schema_metadata.json. The cache is keyed by the applied
+MikroORM migrations (mikro_orm_migrations), so runs against an unchanged
+schema skip the catalog entirely; applying a migration invalidates it.
+"""
+
+import hashlib
+import json
+import os
+
+import import_db
+
+CACHE_DIR = os.environ.get(
+    'IMPORT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.import_cache'),
+)
+METADATA_CACHE_FILE = os.path.join(CACHE_DIR, 'schema_metadata.json')
+
+# Bump when the shape of the cached metadata changes
+METADATA_VERSION = 2
+
+METADATA_SQL = """
+SELECT
+    c.relname AS table_name,
+    (
+        SELECT json_agg(json_build_object(
+                   'name', a.attname,
+                   'type', format_type(a.atttypid, a.atttypmod),
+                   'not_null', a.attnotnull,
+                   'has_default', a.atthasdef OR a.attidentity <> '',
+                   'enum', t.typtype = 'e'
+               ) ORDER BY a.attnum)
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ) AS columns,
+    (
+        SELECT json_agg(json_build_object(
+                   'name', con.conname,
+                   'type', con.contype,
+                   'columns', (
+                       SELECT json_agg(a.attname ORDER BY k.ord)
+                       FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                       JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                   ),
+                   'ref_table', rc.relname,
+                   'ref_columns', (
+                       SELECT json_agg(a.attname ORDER BY k.ord)
+                       FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+                       JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                   )
+               ) ORDER BY con.conname)
+        FROM pg_constraint con
+        LEFT JOIN pg_class rc ON rc.oid = con.confrelid
+        WHERE con.conrelid = c.oid AND con.contype IN ('p', 'u', 'f')
+    ) AS constraints,
+    (
+        -- Unique indexes that do not back a constraint (CREATE UNIQUE INDEX)
+        SELECT json_agg(json_build_object(
+                   'name', ic.relname,
+                   'columns', (
+                       SELECT json_agg(a.attname ORDER BY k.ord)
+                       FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+                       JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                   )
+               ) ORDER BY ic.relname)
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = c.oid
+          AND i.indisunique AND NOT i.indisprimary
+          AND i.indpred IS NULL AND i.indexprs IS NULL
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint x WHERE x.conindid = i.indexrelid)
+    ) AS unique_indexes
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %s AND c.relname = ANY(%s) AND c.relkind IN ('r', 'p')
+"""
+
+
+def migration_state(db):
+    """Hash of the applied MikroORM migrations, or None if unavailable"""
+    try:
+        rows = db.query("SELECT name FROM public.mikro_orm_migrations ORDER BY id")
+    except import_db.Error:
+        return None
+    names = '\n'.join(row.name for row in rows)
+    return hashlib.sha256(names.encode('utf-8')).hexdigest()
+
+
+def fetch_metadata(db, tables, schema='public'):
+    """Metadata of all tables from one catalog query: {table: metadata}"""
+    metadata = {}
+    for row in db.query(METADATA_SQL, (schema, list(tables))):
+        constraints = row.constraints or []
+        primary_key = next((c['columns'] for c in constraints if c['type'] == 'p'), [])
+        unique = [c['columns'] for c in constraints if c['type'] == 'u']
+        unique += [i['columns'] for i in (row.unique_indexes or []) if i['columns']]
+        metadata[row.table_name] = {
+            'columns': row.columns or [],
+            'primary_key': primary_key,
+            'unique': unique,
+            'foreign_keys': [
+                {
+                    'name': c['name'],
+                    'columns': c['columns'],
+                    'ref_table': c['ref_table'],
+                    'ref_columns': c['ref_columns'],
+                }
+                for c in constraints if c['type'] == 'f'
+            ],
+        }
+    return metadata
+
+
+def _read_cache():
+    try:
+        with open(METADATA_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = METADATA_CACHE_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp_path, METADATA_CACHE_FILE)
+    except OSError as e:
+        print(f"  WARNING: Could not write schema cache {METADATA_CACHE_FILE}: {e}")
+
+
+def cached_metadata(tables):
+    """Metadata of all tables from the cache alone (not checked against the
+    applied migrations), or None if the cache does not cover them"""
+    cache = _read_cache()
+    if cache.get('version') != METADATA_VERSION:
+        return None
+    if not all(t in cache.get('tables', {}) for t in tables):
+        return None
+    return cache['tables']
+
+
+def load_metadata(db, tables, refresh=False):
+    """Metadata of all target tables, from the cache when the applied
+    migrations are unchanged, else from one catalog query"""
+    state = migration_state(db)
+    cache = _read_cache()
+    if (
+        not refresh
+        and state is not None
+        and cache.get('version') == METADATA_VERSION
+        and cache.get('migration_state') == state
+        and all(t in cache.get('tables', {}) for t in tables)
+    ):
+        return cache['tables']
+
+    metadata = fetch_metadata(db, tables)
+    if state is not None:
+        _write_cache({
+            'version': METADATA_VERSION,
+            'migration_state': state,
+            'tables': metadata,
+        })
+    return metadata
+
+
+def column_names(metadata, table_name):
+    """Column names of a table in ordinal order (empty if unknown)"""
+    return [col['name'] for col in metadata.get(table_name, {}).get('columns', [])]
+
+
+def column_types(metadata, table_name):
+    """{column name: formatted type} for a table"""
+    return {col['name']: col['type'] for col in metadata.get(table_name, {}).get('columns', [])}
+
+
+def enum_columns(metadata, table_name):
+    """Names of a table's columns whose type is an enum"""
+    return {col['name'] for col in metadata.get(table_name, {}).get('columns', []) if col.get('enum')}
+
+
+def primary_key(metadata, table_name):
+    """Primary key columns of a table (empty if none or unknown)"""
+    return metadata.get(table_name, {}).get('primary_key', [])
+
+
+def unique_constraints(metadata, table_name):
+    """Column lists of a table's unique constraints and unique indexes"""
+    return metadata.get(table_name, {}).get('unique', [])
+
+
+def foreign_key_dependencies(metadata, tables):
+    """FK dependencies between the given tables: {table: [referenced tables]}.
+    Self-references are ignored."""
+    scheduled = set(tables)
+    dependencies = {table: [] for table in tables}
+    for table in tables:
+        for fk in metadata.get(table, {}).get('foreign_keys', []):
+            ref = fk['ref_table']
+            if ref in scheduled and ref != table and ref not in dependencies[table]:
+                dependencies[table].append(ref)
+    return dependencies
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Sidecar capture of dump-only columns for the historical import (--sidecar).
+
+Some dump tables carry columns the local schema does not have (orders: 13 of
+its 26 columns - order_items, subtotal, tax, discount, total, currency,
+billing_address JSON, ...). With --sidecar those columns are kept instead of dropped: in the
+same streaming pass that projects the matching columns into the target
+table, each dump row's extra columns are captured, keyed by the row's
+primary key, and loaded into a sidecar table (public.<table>_dump_extra) in
+the same transaction as the batch.
+
+JSON columns listed in the config are parsed once, here, into plain columns
+(billing city, state, country, ...) with countries and US states normalized
+like the imported columns, so nobody has to re-read the dump or re-parse the
+JSON to answer questions about historical tax or addresses.
+
+The sidecar table is created if missing. Its columns are the primary key
+(typed like the target table), every dump-only column verbatim as text, and
+the fields extracted from JSON columns.
+"""
+
+import json
+
+import import_binary
+import import_db
+import import_normalize
+import import_schema
+import import_transform
+
+NULL = b'\\N'
+
+STAGING_TABLE = 'tmp_sidecar'
+
+
+class Sidecar:
+    """The sidecar table of one target table and the row layout feeding it"""
+
+    def __init__(self, metadata, table_name, config, dump_columns, skipped):
+        self.table_name = config.get('table', f"{table_name}_dump_extra")
+        dump_pos = {name: i for i, name in enumerate(dump_columns)}
+        self.key = import_schema.primary_key(metadata, table_name)
+        types = import_schema.column_types(metadata, table_name)
+        self.key_types = [types[col] for col in self.key]
+        self.key_sources = [dump_pos[col] for col in self.key]
+        self.extra = [(name, dump_pos[name]) for name in skipped if name in dump_pos]
+
+        # (dump index, [(sidecar column, JSON keys, resolver or None)])
+        self.json = []
+        for name, fields in config.get('json', {}).items():
+            if name not in dump_pos:
+                continue
+            extracted = []
+            for column, spec in fields.items():
+                keys = spec['keys'] if isinstance(spec, dict) else spec
+                keys = (keys,) if isinstance(keys, str) else tuple(keys)
+                resolver = spec.get('normalize') if isinstance(spec, dict) else None
+                extracted.append((column, keys, import_normalize.RESOLVERS.get(resolver)))
+            self.json.append((dump_pos[name], extracted))
+
+        self.columns = (
+            self.key
+            + [name for name, _ in self.extra]
+            + [column for _, extracted in self.json for column, _, _ in extracted]
+        )
+        self.parse_errors = 0
+
+    @classmethod
+    def for_table(cls, metadata, table_name, config, dump_columns, skipped):
+        """Sidecar of a table, or None if it has nothing to capture or no
+        primary key in the dump"""
+        key = import_schema.primary_key(metadata, table_name)
+        if not config or not skipped or not key or not dump_columns:
+            return None
+        if any(col not in dump_columns for col in key):
+            return None
+        return cls(metadata, table_name, config, dump_columns, skipped)
+
+    def create(self, cur):
+        """Create the sidecar table if needed and the session's staging table"""
+        definitions = [f"{col} {col_type}" for col, col_type in zip(self.key, self.key_types)]
+        definitions += [f"{col} text" for col in self.columns[len(self.key):]]
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS public.{self.table_name} (
+                {', '.join(definitions)},
+                PRIMARY KEY ({', '.join(self.key)})
+            )
+        """)
+        cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        cur.execute(f"""
+            CREATE TEMP TABLE {STAGING_TABLE} (LIKE public.{self.table_name})
+            ON COMMIT DELETE ROWS
+        """)
+
+    def drop_staging(self, cur):
+        cur.execute(f"DROP TABLE {STAGING_TABLE}")
+
+    def row(self, fields):
+        """Sidecar COPY row (bytes) for a dump row split into fields"""
+        width = len(fields)
+        out = [fields[i] if i < width else NULL for i in self.key_sources]
+        out += [fields[i] if i < width else NULL for _, i in self.extra]
+        for idx, extracted in self.json:
+            document = self._parse(fields[idx] if idx < width else NULL)
+            for _, keys, resolver in extracted:
+                out.append(_field(document, keys, resolver))
+        return b'\t'.join(out)
+
+    def _parse(self, value):
+        if value == NULL or not value:
+            return None
+        try:
+            document = json.loads(import_binary.unescape(value))
+        except (ValueError, UnicodeDecodeError):
+            self.parse_errors += 1
+            return None
+        return document if isinstance(document, dict) else None
+
+    def load(self, cur, rows):
+        """Stage sidecar rows and merge them; returns rows added"""
+        if not rows:
+            return 0
+        import_db.copy_block(cur, STAGING_TABLE, self.columns, b'\n'.join(rows) + b'\n')
+        columns = ', '.join(self.columns)
+        cur.execute(f"""
+            INSERT INTO public.{self.table_name} ({columns})
+            SELECT {columns} FROM {STAGING_TABLE}
+            ON CONFLICT ({', '.join(self.key)}) DO NOTHING
+        """)
+        added = cur.rowcount
+        cur.execute(f"TRUNCATE {STAGING_TABLE}")
+        return added
+
+
+def _field(document, keys, resolver):
+    """COPY text of the first of keys present in a parsed JSON object"""
+    if document is None:
+        return NULL
+    for key in keys:
+        value = document.get(key)
+        if value is None or value == '':
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        if resolver is not None:
+            value = resolver.resolve(value) or value
+        return import_transform.copy_escape(value)
+    return NULL
+
+
+class SidecarPlan:
+    """ProjectionPlan wrapper that splits each dump row once and captures
+    its sidecar row while projecting it; the rows of the current load
+    attempt collect in `pending`"""
+
+    def __init__(self, plan, sidecar):
+        self.plan = plan
+        self.sidecar = sidecar
+        self.sources = plan.sources
+        self.width = plan.width
+        self.normalizers = plan.normalizers
+        self.pending = []
+
+    def apply(self, row):
+        fields = row.split(b'\t')
+        self.pending.append(self.sidecar.row(fields))
+        return self.plan.apply_fields(fields)
+
+    def iter_apply(self, rows):
+        self.pending = []
+        return map(self.apply, rows)
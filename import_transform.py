@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Row projection plans for the historical import.
+
+A table config (skip_indices + column_reorder + num_local_cols +
+iso_normalize, see TABLE_CONFIGS in import_historical_final.py) is compiled
+once into a single tuple of source indices, one per output column, with NULL
+fill for output columns nothing maps to. Applying the plan to a row is one
+split, a code-table lookup per normalized field and one itemgetter call: no
+filtered list, no per-column membership tests and no reorder loop.
+
+Rows are COPY text rows as bytes (tab separated, no newline).
+"""
+
+import threading
+from operator import itemgetter
+
+NULL = b'\\N'
+
+# Characters COPY text escapes, in the order they must be escaped
+_COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+
+
+class ProjectionPlan:
+    """Compiled dump-row -> local-row projection"""
+
+    __slots__ = ('sources', 'width', 'normalizers', '_getter', '_pad')
+
+    def __init__(self, sources, width, normalizers=()):
+        # sources: dump column index per output column, None for NULL fill
+        # normalizers: (dump column index, CodeTable) pairs
+        self.sources = tuple(sources)
+        self.width = width
+        self.normalizers = tuple(normalizers)
+        # Missing columns (and NULL fill) read slot `width`, which apply()
+        # pads with NULL; rows shorter than `width` are padded the same way
+        indices = [width if src is None else src for src in self.sources]
+        if len(indices) == 1:
+            getter = itemgetter(indices[0])
+            self._getter = lambda fields: (getter(fields),)
+        else:
+            self._getter = itemgetter(*indices)
+        self._pad = [NULL] * (width + 1)
+
+    def apply(self, row):
+        """Project one dump row (bytes) to the local column layout"""
+        return self.apply_fields(row.split(b'\t'))
+
+    def apply_fields(self, fields):
+        """Project a dump row already split into fields (list, modified)"""
+        missing = self.width + 1 - len(fields)
+        if missing > 0:
+            fields += self._pad[:missing]
+        for idx, table in self.normalizers:
+            fields[idx] = table[fields[idx]]
+        return b'\t'.join(self._getter(fields))
+
+    def iter_apply(self, rows):
+        """Lazily project an iterable of rows"""
+        return map(self.apply, rows)
+
+
+def needs_transform(config):
+    """True if a table config changes rows at all"""
+    return bool(
+        config.get('skip_indices')
+        or config.get('column_reorder')
+        or config.get('iso_normalize')
+    )
+
+
+def compile_plan(config, width, normalizers=None):
+    """Compile a table config into a ProjectionPlan.
+
+    width is the number of columns in the dump rows. normalizers maps an
+    iso_normalize field type (e.g. 'country') to a CodeTable, or to a
+    callable returning a fresh one per column. Returns None if the
+    config leaves rows unchanged.
+    """
+    if not needs_transform(config):
+        return None
+
+    skip = set(config.get('skip_indices') or ())
+    kept = [i for i in range(width) if i not in skip]
+    column_reorder = config.get('column_reorder')
+
+    if column_reorder:
+        num_local_cols = config.get('num_local_cols', len(kept))
+        sources = [None] * num_local_cols
+        for src_idx, dst_idx in column_reorder.items():
+            if src_idx < len(kept):
+                sources[dst_idx] = kept[src_idx]
+    else:
+        sources = kept
+
+    normalizers = normalizers or {}
+    steps = []
+    for col_idx, field_type in sorted((config.get('iso_normalize') or {}).items()):
+        if col_idx < width and field_type in normalizers:
+            steps.append((col_idx, table_for(normalizers[field_type], col_idx)))
+
+    return ProjectionPlan(sources, width, steps)
+
+
+def table_for(normalizer, column):
+    """The code table of one column: the normalizer itself, or a fresh table
+    from a normalizer factory called with the dump column index"""
+    return normalizer if isinstance(normalizer, dict) else normalizer(column)
+
+
+class CodeTable(dict):
+    """{bytes: bytes} code table that fills itself in on first sight of a
+    value, so each distinct value is looked at once and every other cell is a
+    plain dict hit.
+
+    resolve(str) returns the canonical str, or None to keep the value as is
+    (recorded in `unmapped`). Without resolve, unknown values pass through.
+    """
+
+    def __init__(self, mapping=(), resolve=None, name=None):
+        super().__init__(mapping)
+        self.resolve = resolve
+        self.name = name
+        self.unmapped = set()
+        self._lock = threading.Lock()
+        self[NULL] = NULL
+        self[b''] = b''
+
+    def __missing__(self, value):
+        canonical = None
+        if self.resolve is not None:
+            try:
+                canonical = self.resolve(value.decode('utf-8'))
+            except UnicodeDecodeError:
+                canonical = None
+            if canonical is None:
+                with self._lock:
+                    self.unmapped.add(value)
+        result = value if canonical is None else canonical.encode('utf-8')
+        self[value] = result
+        return result
+
+
+def copy_escape(value):
+    """COPY text form (bytes) of a str value"""
+    for char, escaped in _COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value.encode('utf-8')
+
+
+def code_table(mapping):
+    """Static code table for a str -> str normalization mapping"""
+    return CodeTable({k.encode('utf-8'): v.encode('utf-8') for k, v in mapping.items()})
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Client-side unique-constraint pre-validation for the historical import.
+
+Loads the values of every unique constraint of a target table (besides the
+primary key, which ON CONFLICT handles) into hash maps with one COPY query,
+then classifies dump rows in the streaming pass before anything is sent:
+
+- existing   the value belongs to a different row already in the table
+- duplicate  the value was already used by an earlier row of the dump
+
+Conflicting rows are written to the table's reject file instead of being
+staged, so the server never has to find clashes with a correlated EXISTS over
+the staging table, and a clash never fails a batch.
+
+Values are compared in COPY text form (the form both the dump and COPY TO use);
+NULLs never conflict. A batch's values only count as used by the dump once
+claim() is called after the batch has loaded, and not for the rows the load
+rejected, so a batch that is rolled back and retried does not clash with
+itself and a row that never loaded does not hold its value.
+"""
+
+import import_delta
+import import_schema
+
+NULL = b'\\N'
+
+
+class UniqueValidator:
+    """Drops rows that would violate a non-primary unique constraint"""
+
+    def __init__(self, db, metadata, table_name, col_list, plan):
+        self.table_name = table_name
+        self.conflicts = {}
+        primary_key = import_schema.primary_key(metadata, table_name)
+
+        # Constraints whose columns are all loaded, with their dump indices
+        self.constraints = []
+        for columns in import_schema.unique_constraints(metadata, table_name):
+            if columns == primary_key:
+                continue
+            sources = import_delta.key_sources(col_list, plan, columns)
+            if sources is not None:
+                self.constraints.append((columns, sources))
+        self.pk_sources = (
+            import_delta.key_sources(col_list, plan, primary_key) if primary_key else None)
+
+        # {constraint index: {value: owning primary key}}, existing and dump;
+        # tables without a primary key own values by dump row ordinal
+        self.existing = [{} for _ in self.constraints]
+        self.seen = [{} for _ in self.constraints]
+        self.pending = [{} for _ in self.constraints]
+        # (values, owner) per accepted row of the last filtered batch
+        self.held = []
+        self.ordinal = 0
+        if self.constraints:
+            self._load_existing(db, primary_key)
+
+    def _load_existing(self, db, primary_key):
+        """One COPY of the primary key plus every unique column"""
+        select = list(primary_key)
+        for columns, _ in self.constraints:
+            select += columns
+        collector = _RowCollector()
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY (SELECT {', '.join(select)} FROM public.{self.table_name}) TO STDOUT",
+                collector)
+        width = len(primary_key)
+        for fields in collector.rows():
+            owner = tuple(fields[:width])
+            pos = width
+            for i, (columns, _) in enumerate(self.constraints):
+                value = tuple(fields[pos:pos + len(columns)])
+                pos += len(columns)
+                if NULL not in value:
+                    self.existing[i][value] = owner
+
+    @property
+    def active(self):
+        return bool(self.constraints)
+
+    def filter(self, rows, rejects, batch_offset=None):
+        """The rows of a batch that conflict with nothing; conflicting rows
+        are written to rejects. The accepted rows' values are held until
+        claim()."""
+        if not self.constraints:
+            return rows
+        self.pending = [{} for _ in self.constraints]
+        self.held = []
+        accepted = []
+        for index, row in enumerate(rows):
+            fields = row.split(b'\t')
+            if self.pk_sources is not None:
+                owner = tuple(fields[i] for i in self.pk_sources)
+            else:
+                owner = self.ordinal
+            self.ordinal += 1
+            conflict = self._conflict(fields, owner)
+            if conflict is None:
+                accepted.append(row)
+                self._hold(fields, owner)
+            else:
+                kind, columns, value = conflict
+                name = f"{kind}:{','.join(columns)}"
+                self.conflicts[name] = self.conflicts.get(name, 0) + 1
+                rejects.add_conflict(row, kind, columns, value, batch_offset, index)
+        return accepted
+
+    def claim(self, rejected=()):
+        """Mark the values of the last filtered batch as used, once it
+        loaded; rejected are the positions of accepted rows the load
+        rejected anyway, whose values stay free"""
+        rejected = set(rejected)
+        for position, (values, owner) in enumerate(self.held):
+            if position in rejected:
+                continue
+            for seen, value in zip(self.seen, values):
+                if value is not None:
+                    seen.setdefault(value, owner)
+        self.pending = [{} for _ in self.constraints]
+        self.held = []
+
+    def _conflict(self, fields, owner):
+        for i, (columns, sources) in enumerate(self.constraints):
+            value = tuple(fields[s] for s in sources)
+            if NULL in value:
+                continue
+            holder = self.existing[i].get(value)
+            if holder is not None and holder != owner:
+                return 'existing', columns, value
+            for used in (self.seen[i], self.pending[i]):
+                holder = used.get(value)
+                if holder is not None and holder != owner:
+                    return 'duplicate', columns, value
+        return None
+
+    def _hold(self, fields, owner):
+        values = []
+        for i, (columns, sources) in enumerate(self.constraints):
+            value = tuple(fields[s] for s in sources)
+            if NULL in value:
+                value = None
+            else:
+                self.pending[i].setdefault(value, owner)
+            values.append(value)
+        self.held.append((values, owner))
+
+
+class _RowCollector:
+    """File-like sink for COPY TO STDOUT that keeps the split rows"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._chunks.append(data)
+
+    def rows(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        for line in data.split(b'\n'):
+            if line:
+                yield line.split(b'\t')
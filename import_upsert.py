@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Merge of staged rows into a target table, insert-only or upsert (--upsert).
+
+By default staged rows are merged with ON CONFLICT DO NOTHING, so a row
+already in the table is never touched. With --upsert a row whose primary key
+exists updates it, but only when it actually changed:
+
+- changed  any loaded column IS DISTINCT FROM the stored value
+- newer    the dump's updated_at is later than the stored one (tables
+           without a loaded updated_at fall back to changed)
+
+Unchanged rows are filtered by the ON CONFLICT ... WHERE clause, so they
+write no new row version and leave no dead tuple behind. The merge returns
+(xmax = 0) per written row, which tells inserts from updates; rows neither
+inserted nor updated were unchanged.
+
+ON CONFLICT DO UPDATE may not touch a row twice in one statement, so when
+upserting only the last staged row of each key is merged (staging tables
+are filled by COPY in dump order).
+
+Postgres's MERGE statement could do the same, but it cannot RETURN rows
+before Postgres 17 and would need its own handling of unique violations;
+ON CONFLICT is what every loader here already uses.
+"""
+
+import import_schema
+
+MODES = ('changed', 'newer')
+
+# Column compared by --upsert newer
+VERSION_COLUMN = 'updated_at'
+
+# Types without an equality operator, compared through another type
+COMPARE_AS = {
+    'json': 'jsonb',
+    'xml': 'text',
+}
+
+
+class Merge:
+    """The INSERT ... SELECT that merges a staging table into a target"""
+
+    def __init__(self, metadata, table_name, columns, mode=None):
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.key = import_schema.primary_key(metadata, table_name) or ['id']
+        self.mode = mode
+        types = import_schema.column_types(metadata, table_name)
+        self.updated = [col for col in self.columns if col not in self.key]
+        if mode == 'newer' and VERSION_COLUMN not in self.updated:
+            self.mode = 'changed'
+        if not self.updated or any(col not in self.columns for col in self.key):
+            # Nothing to update beyond the key, or no key to match rows on
+            self.mode = None
+        self._compare = [
+            (col, COMPARE_AS.get(types.get(col, 'text'))) for col in self.updated
+        ]
+
+    def _condition(self):
+        if self.mode == 'newer':
+            return (f"t.{VERSION_COLUMN} IS NULL AND EXCLUDED.{VERSION_COLUMN} IS NOT NULL"
+                    f" OR EXCLUDED.{VERSION_COLUMN} > t.{VERSION_COLUMN}")
+        stored = []
+        staged = []
+        for col, cast in self._compare:
+            suffix = f"::{cast}" if cast else ''
+            stored.append(f"t.{col}{suffix}")
+            staged.append(f"EXCLUDED.{col}{suffix}")
+        return f"ROW({', '.join(stored)}) IS DISTINCT FROM ROW({', '.join(staged)})"
+
+    def sql(self, select, source, key_select=None):
+        """Merge statement for `SELECT select FROM source`; key_select are
+        the select expressions of the primary key (default: its columns)"""
+        columns = ', '.join(self.columns)
+        if self.mode is None:
+            return f"""
+                INSERT INTO public.{self.table_name} ({columns})
+                SELECT {', '.join(select)} FROM {source}
+                ON CONFLICT ({', '.join(self.key)}) DO NOTHING
+            """
+        keys = ', '.join(key_select or self.key)
+        assignments = ', '.join(f"{col} = EXCLUDED.{col}" for col in self.updated)
+        return f"""
+            WITH merged AS (
+                INSERT INTO public.{self.table_name} AS t ({columns})
+                SELECT DISTINCT ON ({keys}) {', '.join(select)} FROM {source}
+                ORDER BY {keys}, ctid DESC
+                ON CONFLICT ({', '.join(self.key)}) DO UPDATE SET {assignments}
+                WHERE {self._condition()}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE inserted),
+                COUNT(*) FILTER (WHERE NOT inserted)
+            FROM merged
+        """
+
+    def run(self, cur, select, source, key_select=None, params=None):
+        """Merge the staged rows; returns (inserted, updated)"""
+        cur.execute(self.sql(select, source, key_select), params)
+        if self.mode is None:
+            return cur.rowcount, 0
+        inserted, updated = cur.fetchone()
+        return inserted, updated
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Offline type validation of transformed rows (--dry-run).
+
+Runs every table's rows through the same projection the import uses and
+checks each field against the target column's type from the schema cache
+(import_schema.py), without sending anything to the database:
+
+- the row has as many fields as there are target columns
+- NULL only in nullable columns
+- the value parses as the column type (integers in range, numerics within
+  precision, booleans, uuids, dates and timestamps, valid JSON, varchar and
+  char lengths) and is valid UTF-8
+
+The dump is cut into ranges of whole rows that worker processes validate in
+parallel, one per core. Failures are counted per column, with a few sample
+rows each. The checks follow what Postgres's input functions accept for the
+forms a dump contains; enum labels and types not listed in VALIDATORS are
+not checked.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+from datetime import date
+
+import dump_index
+import import_binary
+import import_schema
+
+NULL = b'\\N'
+
+# Dump bytes per validation task
+RANGE_BYTES = 4 << 20
+# Rows handed to the projection at a time inside a task
+CHUNK_ROWS = 10000
+# Sample rows kept per failing column
+SAMPLES_PER_COLUMN = 3
+
+COUNT_COLUMN = '(column count)'
+
+_BOOLEANS = {b't', b'true', b'y', b'yes', b'on', b'1', b'f', b'false', b'n', b'no', b'off', b'0'}
+_SPECIAL_TIMES = {b'infinity', b'-infinity', b'epoch'}
+_INTEGER_RE = re.compile(rb'^\s*[+-]?\d+\s*$')
+_NUMERIC_RE = re.compile(rb'^\s*[+-]?(\d*)(?:\.(\d*))?(?:[eE][+-]?\d+)?\s*$')
+_DATE_RE = re.compile(rb'^(\d{4,})-(\d{1,2})-(\d{1,2})')
+_TIMESTAMP_RE = re.compile(
+    rb'^(\d{4,})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d\d)(?::(\d\d)(?:\.\d+)?)?)?'
+    rb'\s*(?:Z|[+-]\d{1,2}(?::?\d\d){0,2}|[A-Za-z][A-Za-z0-9/_+-]*)?(?: BC)?$')
+_HEX = set(b'0123456789abcdefABCDEF')
+
+
+def _integer(low, high):
+    def check(value):
+        if not _INTEGER_RE.match(value) or not low <= int(value) <= high:
+            raise ValueError("not an integer in range")
+    return check
+
+
+def _float(value):
+    if b'_' in value:
+        raise ValueError("not a number")
+    float(value)
+
+
+def _numeric(precision=None, scale=None):
+    def check(value):
+        if value.strip() in (b'NaN', b'Infinity', b'-Infinity', b'inf', b'-inf'):
+            return
+        match = _NUMERIC_RE.match(value)
+        if not match or not (match.group(1) or match.group(2)):
+            raise ValueError("not a number")
+        if precision is not None:
+            digits = len(match.group(1).lstrip(b'0'))
+            if b'e' in value.lower():
+                digits = len(str(int(abs(float(value)))).lstrip('0'))
+            if digits > precision - (scale or 0):
+                raise ValueError(f"more than {precision - (scale or 0)} integer digits")
+    return check
+
+
+def _boolean(value):
+    if value.strip().lower() not in _BOOLEANS:
+        raise ValueError("not a boolean")
+
+
+def _uuid(value):
+    digits = value.strip().strip(b'{}').replace(b'-', b'')
+    if len(digits) != 32 or not set(digits) <= _HEX:
+        raise ValueError("not a uuid")
+
+
+def _calendar(match):
+    date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+
+def _date(value):
+    if value.strip().lower() in _SPECIAL_TIMES:
+        return
+    match = _DATE_RE.match(value)
+    if not match or len(value) > len(match.group(0)) + 3:
+        raise ValueError("not a date")
+    _calendar(match)
+
+
+def _timestamp(value):
+    if value.strip().lower() in _SPECIAL_TIMES:
+        return
+    match = _TIMESTAMP_RE.match(value)
+    if not match:
+        raise ValueError("not a timestamp")
+    _calendar(match)
+    if match.group(4) and (int(match.group(4)) > 24 or int(match.group(5)) > 59
+                           or int(match.group(6) or 0) > 60):
+        raise ValueError("time out of range")
+
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not JSON")
+
+
+def _json(value):
+    json.loads(import_binary.unescape(value), parse_constant=_reject_constant)
+
+
+def _length(limit):
+    def check(value):
+        if len(import_binary.unescape(value).decode('utf-8').rstrip(' ')) > limit:
+            raise ValueError(f"longer than {limit}")
+    return check
+
+
+VALIDATORS = {
+    'smallint': _integer(-(1 << 15), (1 << 15) - 1),
+    'integer': _integer(-(1 << 31), (1 << 31) - 1),
+    'bigint': _integer(-(1 << 63), (1 << 63) - 1),
+    'real': _float,
+    'double precision': _float,
+    'numeric': _numeric(),
+    'boolean': _boolean,
+    'uuid': _uuid,
+    'date': _date,
+    'timestamp without time zone': _timestamp,
+    'timestamp with time zone': _timestamp,
+    'json': _json,
+    'jsonb': _json,
+}
+
+_MODIFIER_RE = re.compile(r'^(numeric|character varying|character)\((\d+)(?:,(\d+))?\)$')
+
+
+def validator_for(col_type):
+    """Check function for a formatted column type, or None if unchecked"""
+    match = _MODIFIER_RE.match(col_type)
+    if match:
+        name, first, second = match.groups()
+        if name == 'numeric':
+            return _numeric(int(first), int(second or 0))
+        return _length(int(first))
+    return VALIDATORS.get(import_binary.base_type(col_type))
+
+
+def block_ranges(reader, table_name, size=RANGE_BYTES):
+    """(start, stop) dump offsets cutting a table's rows into ranges of about
+    size bytes; a compressed dump gives one range per table"""
+    info = reader.block_info(table_name)
+    if info is None:
+        return []
+    if reader.format != 'plain':
+        return [(None, None)]
+    block = reader.block(table_name)
+    ranges = []
+    pos = 0
+    while pos < len(block):
+        cut = min(pos + size, len(block))
+        if cut < len(block):
+            nl = bytes(block[cut:cut + 65536]).find(b'\n')
+            while nl < 0 and cut < len(block):
+                cut += 65536
+                nl = bytes(block[cut:cut + 65536]).find(b'\n')
+            cut = len(block) if nl < 0 else cut + nl + 1
+        ranges.append((info['data_offset'] + pos, info['data_offset'] + cut))
+        pos = cut
+    return ranges
+
+
+class TableResult:
+    """Validation counts of one table (mergeable across ranges)"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.rows = 0
+        self.failed_rows = 0
+        self.columns = {}
+        self.samples = {}
+
+    def fail(self, column, offset, value, row):
+        self.columns[column] = self.columns.get(column, 0) + 1
+        samples = self.samples.setdefault(column, [])
+        if len(samples) < SAMPLES_PER_COLUMN:
+            samples.append({
+                'offset': offset,
+                'value': value.decode('utf-8', 'replace')[:200],
+                'row': row.decode('utf-8', 'replace')[:500],
+            })
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.failed_rows += other.failed_rows
+        for column, count in other.columns.items():
+            self.columns[column] = self.columns.get(column, 0) + count
+        for column, samples in other.samples.items():
+            mine = self.samples.setdefault(column, [])
+            mine.extend(samples[:SAMPLES_PER_COLUMN - len(mine)])
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'failed_rows': self.failed_rows,
+            'columns': self.columns,
+            'samples': self.samples,
+        }
+
+
+def validate_rows(result, rows, offset, plan, col_list, checks):
+    """Project dump rows with plan (None: as they are) and check them;
+    offset is the dump offset of the first row"""
+    width = len(col_list)
+    for source in rows:
+        row = plan.apply(source) if plan is not None else source
+        result.rows += 1
+        fields = row.split(b'\t')
+        failed = False
+        if len(fields) != width:
+            result.fail(COUNT_COLUMN, offset, str(len(fields)).encode(), row)
+            failed = True
+        else:
+            try:
+                row.decode('utf-8')
+                utf8 = True
+            except UnicodeDecodeError:
+                utf8 = False
+            for value, (column, not_null, check) in zip(fields, checks):
+                if value == NULL:
+                    if not_null:
+                        result.fail(column, offset, value, row)
+                        failed = True
+                    continue
+                if check is None and utf8:
+                    continue
+                try:
+                    if not utf8:
+                        value.decode('utf-8')
+                    if check is not None:
+                        check(value)
+                except (ValueError, OverflowError, UnicodeDecodeError):
+                    result.fail(column, offset, value, row)
+                    failed = True
+        if failed:
+            result.failed_rows += 1
+        offset += len(source) + 1
+
+
+# Worker state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(dump_path, fmt, metadata, mappings, resolve_columns):
+    _worker.update(
+        dump_path=dump_path, fmt=fmt, metadata=metadata, mappings=mappings,
+        resolve_columns=resolve_columns, reader=None, plans={})
+
+
+def _table_plan(table_name):
+    plans = _worker['plans']
+    if table_name not in plans:
+        metadata = _worker['metadata']
+        resolved = _worker['resolve_columns'](
+            metadata, _worker['reader'], table_name,
+            _worker['mappings'].get(table_name), lambda message: None)
+        if resolved is None:
+            plans[table_name] = None
+        else:
+            col_list, plan = resolved
+            columns = {col['name']: col for col in metadata[table_name]['columns']}
+            checks = [
+                (col, columns[col]['not_null'], validator_for(columns[col]['type']))
+                for col in col_list
+            ]
+            plans[table_name] = (col_list, plan, checks)
+    return plans[table_name]
+
+
+def _validate_range(task):
+    table_name, start, stop = task
+    if _worker['reader'] is None:
+        _worker['reader'] = dump_index.DumpReader(_worker['dump_path'], _worker['fmt'])
+    result = TableResult(table_name)
+    resolved = _table_plan(table_name)
+    if resolved is None:
+        return result
+    col_list, plan, checks = resolved
+    for chunk_start, _, rows in _worker['reader'].iter_chunks(table_name, CHUNK_ROWS, start, stop):
+        validate_rows(result, rows, chunk_start, plan, col_list, checks)
+    return result
+
+
+def validate(reader, metadata, mappings, tables, resolve_columns, processes=None):
+    """Validate every table's projected rows: {table: TableResult}.
+
+    resolve_columns(metadata, reader, table, mapping, log) -> (columns, plan)
+    is the importer's column resolution, so the rows checked are the rows
+    the import would send.
+    """
+    tasks = [
+        (table, start, stop)
+        for table in tables if reader.row_count(table) and table in metadata
+        for start, stop in block_ranges(reader, table)
+    ]
+    processes = max(1, min(processes or os.cpu_count() or 1, len(tasks) or 1))
+    initargs = (reader.dump_path, reader.format, metadata, mappings, resolve_columns)
+    if processes == 1:
+        _init_worker(*initargs)
+        outcomes = map(_validate_range, tasks)
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        outcomes = pool.imap_unordered(_validate_range, tasks)
+
+    results = {table: TableResult(table) for table in tables if table in metadata}
+    try:
+        for outcome in outcomes:
+            results[outcome.table_name].merge(outcome)
+    finally:
+        if processes > 1:
+            pool.close()
+            pool.join()
+    return results
+
+
+def print_results(results, metadata):
+    """Print per-table and per-column failures; returns rows failed"""
+    total = 0
+    for table, result in results.items():
+        status = "OK" if not result.failed_rows else "FAILED"
+        print(f"  {table}: {result.rows} rows, {result.failed_rows} failed [{status}]")
+        total += result.failed_rows
+        for column, count in sorted(result.columns.items(), key=lambda kv: -kv[1]):
+            col_type = import_schema.column_types(metadata, table).get(column, '')
+            print(f"    {column} {col_type}: {count} bad values")
+            for sample in result.samples.get(column, []):
+                print(f"      at offset {sample['offset']}: {sample['value']!r}")
+    return total